@@ -0,0 +1,170 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+"""
+Benchmarks every panel driver against the virtual backend, no panel needed.
+
+For each driver it times getbuffer (the packing) and records, for init, display and Clear, the
+wall time, the bytes sent over SPI, the GPIO writes, the refreshes and the time the real panel
+would spend in delays and on BUSY. With --output the results are written there as JSON. Given a
+--baseline from an earlier run, anything that got worse is listed and the exit status is 1.
+
+    python3 bench_drivers.py --output bench_drivers.json
+    python3 bench_drivers.py --baseline bench_drivers.json 7in5b_V3 4in2
+"""
+import argparse
+import inspect
+import json
+import platform
+import random
+import sys
+import time
+
+from PIL import Image
+
+import waveshare_epd
+from waveshare_epd import epdconfig
+
+# Simulated BUSY time of every refresh, in ms, roughly what a monochrome panel takes
+REFRESH_MS = 2000
+# Slack allowed on wall times before they count as a regression, relative and in ms. Timings on
+# a Pi jitter a lot, the counts below are what catch a driver doing more work.
+TOLERANCE = 0.5
+TOLERANCE_MS = 2.0
+# Metrics that come from counting rather than timing, any increase is a regression
+EXACT = ("bytes", "gpio", "refreshes", "simulated_ms")
+
+
+def sample_image(width, height, seed=0):
+    """A deterministic mix of white, black and red noise, so every plane has something in it"""
+    rng = random.Random(seed)
+    palette = (b"\xff\xff\xff", b"\x00\x00\x00", b"\xff\x00\x00")
+    data = b"".join(rng.choice(palette) for _ in range(width * height))
+    return Image.frombytes("RGB", (width, height), data)
+
+
+def call_args(epd, method):
+    # The drivers disagree on what init and Clear take, fill in whatever a plain full refresh needs
+    args = []
+    for name, param in list(inspect.signature(method).parameters.items()):
+        if param.default is not inspect.Parameter.empty:
+            continue
+        if name == "lut":
+            args.append(epd.lut_full_update)
+        elif name == "update":
+            args.append(epd.FULL_UPDATE)
+        elif name == "color":
+            args.append(0xFF)
+        else:
+            raise TypeError("don't know what to pass %s.%s for %s" % (type(epd).__module__, method.__name__, name))
+    return args
+
+
+def method(epd, name):
+    # epd1in02 spells its methods Init, Display and Sleep
+    return getattr(epd, name, None) or getattr(epd, name[0].upper() + name[1:])
+
+
+def measure(backend, repeat, func, *args):
+    # The counts are the same on every run, the wall time is the best of them
+    timings = []
+    for _ in range(repeat):
+        backend.reset_stats()
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return {
+        "ms": round(min(timings), 3),
+        "bytes": backend.bytes_sent,
+        "gpio": backend.gpio_writes,
+        "refreshes": backend.refreshes,
+        "simulated_ms": round(backend.delayed_ms + backend.busy_total_ms, 1),
+    }
+
+
+def bench(name, repeat, refresh_ms):
+    backend = epdconfig.create("virtual")
+    backend.refresh_ms = refresh_ms
+    backend.realtime = False
+    epd = waveshare_epd.panel(name, backend)
+    image = sample_image(epd.width, epd.height)
+
+    pack = getattr(epd, "getbuffers", None)
+    if pack is None:
+        pack = lambda image: [epd.getbuffer(image)]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        buffers = pack(image)
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    results = {"getbuffer": {"ms": round(min(timings), 3)}}
+    for phase in ("init", "display", "Clear"):
+        func = method(epd, phase)
+        args = buffers if phase == "display" else call_args(epd, func)
+        results[phase] = measure(backend, repeat, func, *args)
+    return results
+
+
+def regressions(results, baseline, tolerance=TOLERANCE, tolerance_ms=TOLERANCE_MS):
+    """(driver, phase, metric, before, after) for every metric that got worse than the baseline"""
+    found = []
+    for name, phases in sorted(results.items()):
+        for phase, metrics in sorted(phases.items()):
+            before = baseline.get(name, {}).get(phase, {})
+            for metric, after in sorted(metrics.items()):
+                if metric not in before:
+                    continue
+                if metric in EXACT:
+                    worse = after > before[metric]
+                else:
+                    worse = after > before[metric] * (1 + tolerance) + tolerance_ms
+                if worse:
+                    found.append((name, phase, metric, before[metric], after))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the panel drivers on the virtual backend")
+    parser.add_argument("panels", nargs="*", help="panels to run, all of them by default")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of every phase, the fastest one counts")
+    parser.add_argument("--refresh-ms", type=float, default=REFRESH_MS, help="simulated BUSY time of a refresh")
+    parser.add_argument("--output", help="where to write the results, they are only printed without it")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative slack on wall times")
+    options = parser.parse_args()
+
+    results = {}
+    for name in options.panels or waveshare_epd.PANELS:
+        results[name] = bench(name, options.repeat, options.refresh_ms)
+        print("%-12s getbuffer %8.2f ms  display %8.2f ms %8d bytes %6d gpio %8.0f ms simulated" % (
+            name,
+            results[name]["getbuffer"]["ms"],
+            results[name]["display"]["ms"],
+            results[name]["display"]["bytes"],
+            results[name]["display"]["gpio"],
+            results[name]["display"]["simulated_ms"],
+        ))
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "repeat": options.repeat,
+                "refresh_ms": options.refresh_ms,
+                "drivers": results,
+            }, f, indent=2, sort_keys=True)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)["drivers"]
+        found = regressions(results, baseline, options.tolerance)
+        for name, phase, metric, before, after in found:
+            print("REGRESSION %s %s %s: %s -> %s" % (name, phase, metric, before, after))
+        if found:
+            sys.exit(1)
+        print("no regressions against %s" % options.baseline)
+
+
+if __name__ == "__main__":
+    main()
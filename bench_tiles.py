@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+"""
+Checks how much memory drawing the map takes. Runs MappyBoi.build_map, the base map in "L" and the
+radar in "A" onto the black/red canvas as the dashboard draws them, with a tile cache in a
+temporary directory. Instead of downloading them every tile is the same tile of noise, which PNG
+cannot squash, with its URL tacked on after the end of the image. Each one then is a body of its
+own, as big as tiles get, which is only made when asked for and is decoded and scaled by itself.
+
+The growth of the peak resident size over the render is compared with --limit-frames, counted in
+8 bit planes of the 528x880 canvas. The canvas alone is two of them, the base map and the radar one
+each, and every tile in flight (see TILE_WORKERS) about two more. The exit status is 1 if it is
+over. Needs settings.py, as the dashboard does.
+
+    python3 bench_tiles.py --limit-frames 18
+"""
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from src.mappyboi import MappyBoi
+from src.tools import tiles
+from src.tools.images import X_WIDTH, Y_HEIGHT
+from src.tools.tilecache import TileCache
+
+LATITUDE = 52.98
+LONGITUDE = -2.28
+
+
+class _Response:
+    # What fetch_tile hands back, only what _grid_tile reads of it
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+
+def noise_tile():
+    """A tile of random pixels"""
+    data = os.urandom(tiles.TILE_DIMENSION * tiles.TILE_DIMENSION * 4)
+    buf = BytesIO()
+    Image.frombytes("RGBA", (tiles.TILE_DIMENSION, tiles.TILE_DIMENSION), data).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def peak_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts in kilobytes, macOS in bytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the peak memory of drawing the map")
+    parser.add_argument("--zoom", type=int, default=7, help="zoom level of the tiles")
+    parser.add_argument("--limit-frames", type=float, default=18.0, help="most the peak may grow by, in 8 bit canvas planes")
+    options = parser.parse_args()
+
+    # Made before the peak is taken, and decoded once to load PIL's PNG support
+    tile = noise_tile()
+    Image.open(BytesIO(tile)).load()
+    urls = []
+
+    def fetch_tile(url, known=None):
+        urls.append(url)
+        # Readers stop at the end of the image, the URL after it makes every body hash differently
+        return _Response(tile + url.encode())
+
+    tiles.fetch_tile = fetch_tile
+
+    frame = X_WIDTH * Y_HEIGHT / 1024.0 / 1024.0
+    with tempfile.TemporaryDirectory() as root:
+        tiles.tile_cache = TileCache(os.path.join(root, "tiles"))
+        before = peak_kb()
+        start = time.perf_counter()
+        canvas = MappyBoi(lat=LATITUDE, lon=LONGITUDE, zoom=options.zoom).build_map()
+        elapsed = time.perf_counter() - start
+        grown = (peak_kb() - before) / 1024.0
+
+    print("%d tiles onto a %dx%d canvas in %.0f ms, peak grew %.1f MB, %.1f planes of %.2f MB, limit %.1f"
+        % (len(urls), canvas.size[0], canvas.size[1], elapsed * 1000.0, grown, grown / frame, frame, options.limit_frames))
+    if grown > options.limit_frames * frame:
+        raise SystemExit("drawing the map took %.1f planes more than the limit" % (grown / frame - options.limit_frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+import logging
+
+import waveshare_epd
+from src.clock import Clock
+from waveshare_epd import epdcache, epddaemon, epdpartial
+
+logging.basicConfig(
+    filename="clock.log",
+    filemode="a",
+    format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.DEBUG,
+)
+
+# config, the panel the service was started with (python3 paneld.py epd4in2)
+DRIVER = "epd4in2"
+
+
+try:
+    logging.info("Clock")
+
+    canvas = Clock().build_canvas()
+
+    epd = waveshare_epd.panel(DRIVER)
+    frame = epd.getbuffer(canvas.black)
+
+    try:
+        # The service keeps the last frame, so only the digits and departures that changed are refreshed
+        reply = epddaemon.send([frame])
+        logging.info("Handed to the panel service, shown: %s, %s refresh, %s", reply["shown"], reply["refresh"], reply["timings"])
+    except (FileNotFoundError, ConnectionRefusedError):
+        cache = epdcache.FrameCache(epd)
+        if cache.unchanged(frame):
+            logging.info("Frame unchanged, leaving the display asleep")
+        else:
+            # Nothing here knows what the panel shows, so it can only be a full refresh
+            logging.info("No panel service, full refresh")
+            refresher = epdpartial.PartialRefresh(epd)
+            refresher.display(frame)
+            refresher.sleep()
+            cache.store(frame)
+
+except IOError as e:
+    logging.info(e)
+
+except KeyboardInterrupt:
+    logging.info("ctrl + c:")
+    waveshare_epd.driver(DRIVER).epdconfig.module_exit()
+    exit()
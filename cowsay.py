@@ -3,10 +3,9 @@
 
 # I am far too lazy to actually write my own cowsay generator, so I'm just gonna use an API for now
 import logging
-from random import random
 
 from src.cowsay import CowSay
-from waveshare_epd import epd7in5b_V3
+from waveshare_epd import epd7in5b_V3, epdcache, epdclear, epddaemon
 
 logging.basicConfig(
     filename="cowsay.log",
@@ -22,23 +21,38 @@ try:
 
     cowsay = CowSay()
 
-    black_white, red_white = cowsay.build_images()
+    canvas = cowsay.build_canvas()
 
     epd = epd7in5b_V3.EPD()
     # images
-    blackimage = epd.getbuffer(black_white)
-    redimage = epd.getbuffer(red_white)
-
-    logging.info("init and Clear")
-    epd.init()
-    if random() < 0.2:
-        epd.Clear()
-
-    logging.info("Displaying")
-    epd.display(blackimage, redimage)
-
-    logging.info("Go to Sleep for 10 minutes...")
-    epd.sleep()
+    blackimage, redimage = canvas.getbuffers(epd)
+
+    cache = epdcache.FrameCache(epd, keep_buffers=True)
+    clears = epdclear.ClearScheduler(epd)
+    clear = clears.due()
+    previous = cache.buffers()
+    try:
+        reply = epddaemon.send([blackimage, redimage], clear=clear)
+        shown = reply["shown"]
+        logging.info("Handed to the panel service, shown: %s, %s", shown, reply["timings"])
+    except (FileNotFoundError, ConnectionRefusedError):
+        shown = not cache.unchanged(blackimage, redimage)
+        if not shown:
+            logging.info("Frame unchanged, leaving the display asleep")
+        else:
+            logging.info("init and Clear")
+            epd.init()
+            if clear:
+                epd.Clear()
+
+            logging.info("Displaying")
+            epd.display(blackimage, redimage)
+
+            logging.info("Go to Sleep for 10 minutes...")
+            epd.sleep()
+            cache.store(blackimage, redimage)
+    if shown:
+        clears.record([blackimage, redimage], previous, cleared=clear)
 
 except IOError as e:
     logging.info(e)
@@ -6,5 +6,8 @@ scp -r src pi@pi-zero-display.local:/home/pi/
 scp settings.py pi@pi-zero-display.local:/home/pi/
 
 scp mappyboi.py pi@pi-zero-display.local:/home/pi/
+scp radard.py pi@pi-zero-display.local:/home/pi/
 scp cowsay.py pi@pi-zero-display.local:/home/pi/
+scp clock.py pi@pi-zero-display.local:/home/pi/
+scp paneld.py pi@pi-zero-display.local:/home/pi/
 echo "******************** Deployed **********************"
@@ -3,13 +3,12 @@
 import logging
 import traceback
 
-from random import random
 
 from src.mappyboi import MappyBoi
 from settings import ifttt_key
 from src.tools.apis import send_error
 
-from waveshare_epd import epd7in5b_V3
+from waveshare_epd import epd7in5b_V3, epdcache, epdclear, epddaemon
 
 logging.basicConfig(
     filename="display.log",
@@ -30,23 +29,38 @@ try:
 
     mappy_boi = MappyBoi(lat=LAT, lon=LON, zoom=ZOOM)
 
-    black_white, red_white = mappy_boi.build_images()
+    canvas = mappy_boi.build_canvas()
 
     epd = epd7in5b_V3.EPD()
     # images
-    blackimage = epd.getbuffer(black_white)
-    redimage = epd.getbuffer(red_white)
-
-    logging.info("init and Clear")
-    epd.init()
-    if random() < 0.2:
-        epd.Clear()
-
-    logging.info("Displaying")
-    epd.display(blackimage, redimage)
-
-    logging.info("Go to Sleep for 10 minutes...")
-    epd.sleep()
+    blackimage, redimage = canvas.getbuffers(epd)
+
+    cache = epdcache.FrameCache(epd, keep_buffers=True)
+    clears = epdclear.ClearScheduler(epd)
+    clear = clears.due()
+    previous = cache.buffers()
+    try:
+        reply = epddaemon.send([blackimage, redimage], clear=clear)
+        shown = reply["shown"]
+        logging.info("Handed to the panel service, shown: %s, %s", shown, reply["timings"])
+    except (FileNotFoundError, ConnectionRefusedError):
+        shown = not cache.unchanged(blackimage, redimage)
+        if not shown:
+            logging.info("Frame unchanged, leaving the display asleep")
+        else:
+            logging.info("init and Clear")
+            epd.init()
+            if clear:
+                epd.Clear()
+
+            logging.info("Displaying")
+            epd.display(blackimage, redimage)
+
+            logging.info("Go to Sleep for 10 minutes...")
+            epd.sleep()
+            cache.store(blackimage, redimage)
+    if shown:
+        clears.record([blackimage, redimage], previous, cleared=clear)
 
 except IOError as e:
     logging.info(e)
@@ -0,0 +1,26 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+import logging
+import sys
+
+from waveshare_epd import epddaemon
+
+logging.basicConfig(
+    filename="paneld.log",
+    filemode="a",
+    format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.DEBUG,
+)
+
+# config
+DRIVER = sys.argv[1] if len(sys.argv) > 1 else "epd7in5b_V3"
+
+
+try:
+    logging.info("Panel service")
+    epddaemon.serve(DRIVER)
+
+except KeyboardInterrupt:
+    logging.info("ctrl + c:")
+    exit()
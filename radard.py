@@ -0,0 +1,29 @@
+#!/usr/bin/python
+# -*- coding:utf-8 -*-
+import logging
+
+from src.mappyboi import MappyBoi
+from src.tools.radar import RadarPrefetcher
+
+logging.basicConfig(
+    filename="radard.log",
+    filemode="a",
+    format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s",
+    datefmt="%H:%M:%S",
+    level=logging.DEBUG,
+)
+
+# config, the same as mappyboi.py so the right tiles are fetched
+LAT = 52.98
+LON = -2.28
+ZOOM = 7
+
+
+try:
+    logging.info("Radar prefetch")
+    mappy_boi = MappyBoi(lat=LAT, lon=LON, zoom=ZOOM)
+    RadarPrefetcher(mappy_boi.prefetch_radar).run()
+
+except KeyboardInterrupt:
+    logging.info("ctrl + c:")
+    exit()
@@ -0,0 +1,64 @@
+import logging
+from typing import List, Tuple
+
+from PIL import ImageFont
+from settings import realtime_trains_username, realtime_trains_password, train_station
+
+from .dashboard import Dashboard
+from .tools.apis import Service, get_train_departure_times
+from .tools.canvas import Canvas, BLACK
+from .tools.fonts import opensans
+from .tools.utils import get_current_time
+
+# The 4.2" black and white panel the clock is drawn for
+CLOCK_SIZE = (400, 300)
+
+
+class Clock(Dashboard):
+    """
+    Clock is a display mode for a small black and white panel, showing the time and the next
+    trains from the station in settings. It is redrawn every minute, and as only the time and
+    the departures change the panel service refreshes just the part of the panel they are on.
+    """
+
+    def __init__(self, size: Tuple[int, int] = CLOCK_SIZE):
+        self.size = size
+
+    @staticmethod
+    def add_time(canvas: Canvas) -> Canvas:
+        current_time = get_current_time()
+
+        canvas.text((10, -20), current_time.strftime("%H:%M"), ImageFont.truetype(opensans, 110))
+        canvas.text((15, 120), current_time.strftime("%A %-d %B"), ImageFont.truetype(opensans, 20))
+        return canvas
+
+    @staticmethod
+    def add_train_departures(canvas: Canvas, services: List[Service]) -> Canvas:
+        if not services:
+            logging.info("no train services")
+            return canvas
+
+        font = ImageFont.truetype(opensans, 20)
+        pos = 160
+        for service in services[:5]:
+            msg = f"{service.realtime_departure}: {service.destination.description}"
+            # The panel has no red, cancelled trains are marked in the text instead
+            if service.display_as == "CANCELLED_CALL":
+                msg = f"{msg} CNCL"
+            _, h = canvas.textsize(msg, font=font)
+            canvas.text((15, pos), msg, font, BLACK)
+            pos = pos + h
+
+        return canvas
+
+    def build_canvas(self) -> Canvas:
+        """
+        Draws the time and the departures onto a canvas, in black only. The panel shows the
+        black plane.
+        """
+        train_departures = get_train_departure_times(realtime_trains_username, realtime_trains_password, train_station)
+
+        canvas = Canvas(self.size)
+        canvas = Clock.add_time(canvas)
+        canvas = Clock.add_train_departures(canvas, train_departures)
+        return canvas
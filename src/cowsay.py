@@ -1,11 +1,11 @@
 import logging
-from typing import Tuple
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
 
 from src.tools.apis import get_cowsay, get_dad_joke
+from src.tools.canvas import Canvas, RED
 from src.tools.fonts import opensans, robotomono
-from src.tools.images import subtract_top_from_bottom, X_WIDTH, Y_HEIGHT
+from src.tools.images import X_WIDTH, Y_HEIGHT
 from src.tools.utils import get_current_time
 
 from .dashboard import Dashboard
@@ -18,23 +18,19 @@ class CowSay(Dashboard):
     """
 
     @staticmethod
-    def display_text(text: str) -> Image.Image:
-        img = Image.new("RGB", (X_WIDTH, Y_HEIGHT), (255, 255, 255))
-        draw = ImageDraw.Draw(img)
+    def display_text(canvas: Canvas, text: str) -> Canvas:
         font = ImageFont.truetype(robotomono, 26)
 
         splitted = text.splitlines()
 
         distance = 40
         for i, s in enumerate(splitted):
-            draw.text((90, i * distance), s, (0, 0, 0), font=font)
+            canvas.text((90, i * distance), s, font)
 
-        return img
+        return canvas
 
     @staticmethod
-    def display_text_red(text: str) -> Image.Image:
-        img = Image.new("RGB", (X_WIDTH, Y_HEIGHT), (255, 255, 255))
-        draw = ImageDraw.Draw(img)
+    def display_text_red(canvas: Canvas, text: str) -> Canvas:
         font = ImageFont.truetype(robotomono, 26)
 
         splitted = text.splitlines()
@@ -44,35 +40,30 @@ class CowSay(Dashboard):
         for i, s in enumerate(splitted):
             # If it starts with one of limiting characters
             if s[0] == "/":
-                draw.text((90, i * distance), f" {s[1:-2]}", (0, 0, 0), font=font)
+                canvas.text((90, i * distance), f" {s[1:-2]}", font, RED)
             elif s[0] == "|":
-                draw.text((90, i * distance), f" {s[1:-1]}", (0, 0, 0), font=font)
+                canvas.text((90, i * distance), f" {s[1:-1]}", font, RED)
             elif s[0] == "\\":
-                draw.text((90, i * distance), f" {s[1:-1]}", (0, 0, 0), font=font)
+                canvas.text((90, i * distance), f" {s[1:-1]}", font, RED)
 
-        return img
+        return canvas
 
     @staticmethod
-    def add_time(img: Image.Image) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+    def add_time(canvas: Canvas) -> Canvas:
         font = ImageFont.truetype(opensans, 16)
 
         current_time = get_current_time()
 
-        # draw.text((x, y),"Sample Text",(r,g,b))
-        draw.text(
+        canvas.text(
             (X_WIDTH - 75, Y_HEIGHT - 30),
             current_time.strftime("%a, %H:%M"),
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        return img
+        return canvas
 
-    def build_images(self) -> Tuple[Image.Image, Image.Image]:
+    def build_canvas(self) -> Canvas:
         """
-        Builds two bitmap images, one for black/white and another for red/white.
-        For best results, make sure that there is no black/red overlap between the
-        two images.
+        Draws the joke onto a black/white/red canvas, the lines inside the speech bubble in red.
         """
         logging.info("Getting quote...")
 
@@ -82,13 +73,11 @@ class CowSay(Dashboard):
 
         cowsay_text = get_cowsay(quote)
 
-        __black_white_image = CowSay.display_text(cowsay_text)
-        __black_white_image = CowSay.add_time(__black_white_image)
+        canvas = Canvas((X_WIDTH, Y_HEIGHT))
+        canvas = CowSay.display_text(canvas, cowsay_text)
+        canvas = CowSay.add_time(canvas)
 
-        __red_white_image = CowSay.display_text_red(cowsay_text)
+        # Drawn last, so the red text wins where it overlaps the black
+        canvas = CowSay.display_text_red(canvas, cowsay_text)
 
-        __black_white_image = subtract_top_from_bottom(
-            __black_white_image, __red_white_image
-        )
-
-        return __black_white_image, __red_white_image
+        return canvas
@@ -1,8 +1,14 @@
 from typing import Tuple
 from PIL import Image
 
+from .tools.canvas import Canvas
+
 class Dashboard:
   """A generic dashboard class"""
+  def build_canvas(self) -> Canvas:
+    """Draws the dashboard onto a black/white/red canvas to be displayed on the e-ink dashboard"""
+    pass
+
   def build_images(self) -> Tuple[Image.Image, Image.Image]:
     """Builds a black/white and red/white image to be displayed on the e-ink dashboard"""
-    pass
+    return self.build_canvas().images()
@@ -3,9 +3,9 @@
 import logging
 from datetime import datetime
 from random import random
-from typing import List, Tuple
+from typing import List
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageFont
 from settings import birthdays, tomorrow_api_key, latitude, longitude, realtime_trains_username, realtime_trains_password, train_station, openweathermap_api_key
 
 from .dashboard import Dashboard
@@ -27,23 +27,28 @@ from .tools.apis import (
     get_web_graph_count_links,
     get_web_graph_count_pages,
 )
+from .tools.canvas import Canvas, BLACK, RED, WHITE
 from .tools.fonts import opensans, weather
 from .tools.graphing import plot_time_data
+from .tools.httpcache import stats
 from .tools.images import (
     X_WIDTH,
     Y_HEIGHT,
-    rasterize,
-    subtract_top_from_bottom,
     to_bitmap,
 )
 from .tools.tiles import (
-    deg2num,
-    generate_3x5_image,
+    BASE_MAX_AGE,
+    RADAR_MAX_AGE,
     generate_base_map,
     generate_weather_map,
+    prefetch_viewport,
+    render_viewport,
 )
 from .tools.utils import get_current_time, get_time_epoch
 
+# The white box the information panels are drawn in, the map behind it is never seen
+INFO_BOX = (Y_HEIGHT - 250, 0, Y_HEIGHT, 350)
+
 
 class MappyBoi(Dashboard):
     """
@@ -71,75 +76,64 @@ class MappyBoi(Dashboard):
         self.zoom = zoom
 
     @staticmethod
-    def add_time(img: Image.Image) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+    def add_time(canvas: Canvas) -> Canvas:
         font = ImageFont.truetype(opensans, 16)
 
         current_time = get_current_time()
 
-        # draw.text((x, y),"Sample Text",(r,g,b))
-        draw.text(
+        canvas.text(
             (400, 0),
             current_time.strftime("%a, %H:%M"),
-            (255, 255, 255),
-            font=font,
+            font,
+            WHITE,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def draw_top_right_box(img: Image.Image, red: bool = False) -> Image.Image:
-        draw = ImageDraw.Draw(img)
-        draw.rectangle(
-            (Y_HEIGHT - 250, 0, Y_HEIGHT, 350), outline=None, fill=(255, 255, 255)
-        )
-        return img
+    def draw_top_right_box(canvas: Canvas) -> Canvas:
+        canvas.rectangle(INFO_BOX, WHITE)
+        return canvas
 
     @staticmethod
-    def add_raining_soon_graph(img: Image.Image, graph_img) -> Image.Image:
-        img.alpha_composite(graph_img, (Y_HEIGHT - 250, 200))
-        return img
+    def add_raining_soon_graph(canvas: Canvas, graph_img: Image.Image) -> Canvas:
+        canvas.paste(graph_img, (Y_HEIGHT - 250, 200), mask=graph_img)
+        return canvas
 
     @staticmethod
-    def add_temp(img: Image.Image, temp: int) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+    def add_temp(canvas: Canvas, temp: int) -> Canvas:
         font = ImageFont.truetype(opensans, 120)
         weatherfont = ImageFont.truetype(weather, 150)
         temp_text = f"{int(temp) if temp is not None else '?'}"
-        w, _ = draw.textsize(temp_text, font=font)
-        draw.text(
+        w, _ = canvas.textsize(temp_text, font=font)
+        canvas.text(
             ((Y_HEIGHT - 250) + 10, -30),
             temp_text,
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        draw.text(
+        canvas.text(
             ((Y_HEIGHT - 240) + w, -55),
             "\uf03c",
-            (0, 0, 0),
-            font=weatherfont,
+            weatherfont,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def add_aqi(img: Image.Image, quality) -> Image.Image:
+    def add_aqi(canvas: Canvas, quality) -> Canvas:
         if not quality or quality == "unknown":
-            return img
+            return canvas
 
-        draw = ImageDraw.Draw(img)
         font = ImageFont.truetype(opensans, 18)
-        draw.text(
+        canvas.text(
             (Y_HEIGHT - 240, 110),
             f"AQI - {quality}",
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        return img
+        return canvas
 
     @staticmethod
     def add_sunriseset(
-        img: Image.Image, sunrise_time: datetime, sunset_time: datetime
-    ) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+        canvas: Canvas, sunrise_time: datetime, sunset_time: datetime
+    ) -> Canvas:
         font = ImageFont.truetype(opensans, 18)
         current_time = get_current_time()
         weatherfont = ImageFont.truetype(weather, 18)
@@ -149,32 +143,29 @@ class MappyBoi(Dashboard):
         # current > sunrise < sunset then sunset
         # current > sunset then sunrise
         if not sunrise_time or not sunset_time:
-            return img
+            return canvas
         sunthingtodraw = sunrise
         suntimetowrite = sunrise_time
         if current_time > sunrise_time and current_time < sunset_time:
             sunthingtodraw = sunset
             suntimetowrite = sunset_time
-        draw.text(
+        canvas.text(
             (Y_HEIGHT - 240, 140),
             sunthingtodraw,
-            (0, 0, 0),
-            font=weatherfont,
+            weatherfont,
         )
-        draw.text(
+        canvas.text(
             (Y_HEIGHT - 203, 140),
             f"- {suntimetowrite.strftime('%H:%M')}",
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def add_iss_passtime(img: Image.Image, passtimes) -> Image.Image:
+    def add_iss_passtime(canvas: Canvas, passtimes) -> Canvas:
         if not passtimes or len(passtimes["response"]) == 0:
-            return img
+            return canvas
 
-        draw = ImageDraw.Draw(img)
         font = ImageFont.truetype(opensans, 18)
 
         text = "??"
@@ -182,31 +173,25 @@ class MappyBoi(Dashboard):
         next_pass_time = get_time_epoch(next_pass)
         text = next_pass_time.strftime("%-d %b, %H:%M")
 
-        draw.text(
+        canvas.text(
             (Y_HEIGHT - 240, 170),
             f"ISS - {text}",
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def remove_corner(img: Image.Image) -> Image.Image:
-        draw = ImageDraw.Draw(img)
-        draw.rectangle(
-            (Y_HEIGHT - 100, X_WIDTH, Y_HEIGHT, X_WIDTH - 55),
-            outline=None,
-            fill=(255, 255, 255),
-        )
-        return img
+    def remove_corner(canvas: Canvas) -> Canvas:
+        # Only the weather layer has something in the corner, the map under it stays
+        canvas.erase((Y_HEIGHT - 100, X_WIDTH - 55, Y_HEIGHT, X_WIDTH), RED)
+        return canvas
 
     @staticmethod
-    def add_weather_icon(img: Image.Image, icon: str) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+    def add_weather_icon(canvas: Canvas, icon: str) -> Canvas:
         font = ImageFont.truetype(weather, 50)
 
         if icon == 0 or not icon:
-            return img
+            return canvas
 
         code_to_human = {
             1000: "clear",
@@ -268,152 +253,120 @@ class MappyBoi(Dashboard):
         x_rand = int(random() * 10)
         y_rand = int(random() * 10)
 
-        draw.text(
+        canvas.text(
             (Y_HEIGHT - (75 + y_rand), (115 + x_rand)),
             icons[code_to_human[icon]],
-            (0, 0, 0),
-            font=font,
+            font,
+            RED,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def add_count_pages(img: Image.Image) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+    def add_count_pages(canvas: Canvas) -> Canvas:
         font = ImageFont.truetype(opensans, 16)
 
         current_num_pages = get_web_graph_count_pages()
         if current_num_pages == 0:
-            return img
+            return canvas
 
         current_num_links = get_web_graph_count_links()
         if current_num_links == 0:
-            return img
+            return canvas
 
-        draw.text(
+        canvas.text(
             (15, 0),
             f"{(current_num_pages / 1000000):.1f}M pages, {(current_num_links / 1000000):.1f}M links",
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def add_count_vaccinations(img: Image.Image) -> Image.Image:
-        draw = ImageDraw.Draw(img)
+    def add_count_vaccinations(canvas: Canvas) -> Canvas:
         font = ImageFont.truetype(opensans, 20)
 
         UK_POP = 67610000
 
         vaccination_data = get_vaccinations_first_dose()
         if not vaccination_data:
-            return img
+            return canvas
 
-        draw.text(
+        canvas.text(
             (15, 20),
             f"{(vaccination_data['value'] / 1000000):.1f}M vaccinations",
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        draw.text(
+        canvas.text(
             (15, 40),
             f"{(vaccination_data['value'] / UK_POP * 100):.1f}% of UK",
-            (0, 0, 0),
-            font=font,
+            font,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def add_vaccination_progress_bar(
-        black_white_img: Image.Image, red_white_img: Image.Image
-    ) -> Tuple[Image.Image, Image.Image]:
-        bw_draw = ImageDraw.Draw(black_white_img)
-        rw_draw = ImageDraw.Draw(red_white_img)
-
+    def add_vaccination_progress_bar(canvas: Canvas) -> Canvas:
         UK_POP = 67610000
         PROGRESS_BAR_SIZE = 10
 
         vaccination_data_first_dose = get_vaccinations_first_dose()
         if not vaccination_data_first_dose:
-            return black_white_img, red_white_img
+            return canvas
         vaccination_data_second_dose = get_vaccinations_second_dose()
         if not vaccination_data_second_dose:
-            return black_white_img, red_white_img
+            return canvas
         vaccination_data_third_dose = get_vaccinations_third_dose()
         if not vaccination_data_third_dose:
-            return black_white_img, red_white_img
+            return canvas
         # First should be naturally larger than second and third
         first_width = vaccination_data_first_dose["value"] / UK_POP * Y_HEIGHT
         second_width = vaccination_data_second_dose["value"] / UK_POP * Y_HEIGHT
         third_width = vaccination_data_third_dose["value"] / UK_POP * Y_HEIGHT
 
         # Clear red and black space
-        rw_draw.rectangle(
-            (0, 0, Y_HEIGHT, PROGRESS_BAR_SIZE),
-            outline=None,
-            fill=(255, 255, 255),
-        )
-        bw_draw.rectangle(
-            (0, 0, Y_HEIGHT, PROGRESS_BAR_SIZE),
-            outline=None,
-            fill=(255, 255, 255),
-        )
+        canvas.rectangle((0, 0, Y_HEIGHT, PROGRESS_BAR_SIZE), WHITE)
 
         # Draw progress bars with a slight white space at the bottom
         # To represent third dose, we will have the third dose as "white", so the
         # second dose bar will start at third dose length. You still following?
-        bw_draw.rectangle(
-            (third_width, 0, second_width, PROGRESS_BAR_SIZE - 1),
-            outline=None,
-            fill=(0, 0, 0),
-        )
-        rw_draw.rectangle(
-            (second_width, 0, first_width, PROGRESS_BAR_SIZE - 1),
-            outline=None,
-            fill=(0, 0, 0),
-        )
+        canvas.rectangle((third_width, 0, second_width, PROGRESS_BAR_SIZE - 1), BLACK)
+        canvas.rectangle((second_width, 0, first_width, PROGRESS_BAR_SIZE - 1), RED)
 
-        return black_white_img, red_white_img
+        return canvas
 
     @staticmethod
-    def add_birthday(img: Image.Image) -> Image.Image:
+    def add_birthday(canvas: Canvas) -> Canvas:
         current_birthdays = get_birthdays(birthdays)
         if not current_birthdays:
             # If there are no birthdays today :(
-            return img
+            return canvas
 
         # Draw bottom box
-        draw = ImageDraw.Draw(img)
         font = ImageFont.truetype(opensans, 20)
-        draw.rectangle(
-            (0, X_WIDTH, Y_HEIGHT, X_WIDTH - 100), outline=None, fill=(255, 255, 255)
-        )
+        canvas.rectangle((0, X_WIDTH - 100, Y_HEIGHT, X_WIDTH), WHITE)
         # Draw happy birthday
         msg = "Happy birthday!"
-        w, _ = draw.textsize(msg, font=font)
-        draw.text(
+        w, _ = canvas.textsize(msg, font=font)
+        canvas.text(
             ((Y_HEIGHT - w) / 2, X_WIDTH - 100),
             msg,
-            (0, 0, 0),
-            font=font,
+            font,
         )
 
         # Draw names
         namefont = ImageFont.truetype(opensans, 45)
         names = " & ".join(current_birthdays)
-        w, h = draw.textsize(names, font=namefont)
-        draw.text(
+        w, h = canvas.textsize(names, font=namefont)
+        canvas.text(
             ((Y_HEIGHT - w) / 2, X_WIDTH - (10 + h)),
             names,
-            (0, 0, 0),
-            font=namefont,
+            namefont,
         )
-        return img
+        return canvas
 
     @staticmethod
-    def add_train_departures(img: Image.Image, redimg: Image.Image, services: List[Service]) -> Tuple[Image.Image, Image.Image]:
+    def add_train_departures(canvas: Canvas, services: List[Service]) -> Canvas:
         if not services:
             print("no train services")
-            return img, redimg
+            return canvas
 
         # Limit to 8 departures
         services = services[:8]
@@ -421,8 +374,6 @@ class MappyBoi(Dashboard):
         # Filter services not going to london
         services = filter(lambda item: "London" in item.destination.description, services)
 
-        draw = ImageDraw.Draw(img)
-        drawred = ImageDraw.Draw(redimg)
         font = ImageFont.truetype(opensans, 16)
 
         pos = 10
@@ -430,69 +381,84 @@ class MappyBoi(Dashboard):
             msg = f"{service.realtime_departure}: {service.destination.description}"
             if service.display_as == "CANCELLED_CALL":
                 msg = f"{service.realtime_departure}: {service.destination.description} CNCL"
-            w, h = draw.textsize(msg, font=font)
-            draw.rectangle(
-                (0, pos, 5+w, pos + h), outline=None, fill=(255, 255, 255)
-            )
-            drawred.rectangle(
-                (0, pos, 5+w, pos + h), outline=None, fill=(255, 255, 255)
+            w, h = canvas.textsize(msg, font=font)
+            canvas.rectangle((0, pos, 5+w, pos + h), WHITE)
+            canvas.text(
+                (5, pos),
+                msg,
+                font,
+                RED if service.display_as == "CANCELLED_CALL" else BLACK,
             )
-            if service.display_as == "CANCELLED_CALL":
-                drawred.text(
-                    (5, pos),
-                    msg,
-                    (0, 0, 0),
-                    font=font,
-                )
-            else:
-                draw.text(
-                    (5, pos),
-                    msg,
-                    (0, 0, 0),
-                    font=font,
-                )
             pos = pos + h
 
-        return img, redimg
+        return canvas
 
-    def build_images(self) -> Tuple[Image.Image, Image.Image]:
+    def radar(self, fetch):
         """
-        Builds two bitmap images, one for black/white and another for red/white.
-        For best results, make sure that there is no black/red overlap between the
-        two images.
+        Calls render_viewport or prefetch_viewport for the radar layer, so the prefetch asks for
+        exactly the tiles the map is drawn with
         """
+        return fetch(
+            self.lat,
+            self.lon,
+            self.zoom,
+            (Y_HEIGHT, X_WIDTH),
+            generate_weather_map,
+            api_key=openweathermap_api_key,
+            cache="radar",
+            max_age=RADAR_MAX_AGE,
+            frames=True,
+            mode="A",
+            hidden=[INFO_BOX],
+        )
+
+    def prefetch_radar(self) -> int:
+        """Fetches the tiles of the latest radar frame into the tile cache, returns how many are missing"""
+        return self.radar(prefetch_viewport)
+
+    def build_map(self) -> Canvas:
+        """Draws the map with the weather radar in red over it onto a black/white/red canvas"""
         logging.info("Download images...")
 
-        X_TILE, Y_TILE = deg2num(self.lat, self.lon, self.zoom)
+        canvas = Canvas((Y_HEIGHT, X_WIDTH))
 
         logging.info("Base image downloading...")
-        __black_white_image = generate_3x5_image(
-            X_TILE,
-            Y_TILE,
-            self.zoom,
-            generate_base_map,
-            cache="base_weather",
+        canvas.paste(
+            render_viewport(
+                self.lat,
+                self.lon,
+                self.zoom,
+                canvas.size,
+                generate_base_map,
+                cache="base_weather",
+                max_age=BASE_MAX_AGE,
+                mode="L",
+                hidden=[INFO_BOX],
+            )
         )
 
         logging.info("Weather image downloading...")
-        __red_white_image = to_bitmap(
-            generate_3x5_image(
-                X_TILE,
-                Y_TILE,
-                self.zoom,
-                generate_weather_map,
-                api_key=openweathermap_api_key,
+        # Red wins over the map wherever it rains
+        canvas.paste(
+            to_bitmap(
+                self.radar(render_viewport),
+                20,
             ),
-            20,
+            colour=RED,
         )
+        return canvas
+
+    def build_canvas(self) -> Canvas:
+        """
+        Draws the map, the weather radar in red over it, and the information panels onto a
+        black/white/red canvas.
+        """
+        canvas = self.build_map()
 
         logging.info("Getting additional forecast...")
         # Paint an area for this info
-        __black_white_image = MappyBoi.draw_top_right_box(
-            __black_white_image, red=False
-        )
-        __red_white_image = MappyBoi.draw_top_right_box(__red_white_image, red=True)
-        __red_white_image = MappyBoi.remove_corner(__red_white_image)
+        canvas = MappyBoi.draw_top_right_box(canvas)
+        canvas = MappyBoi.remove_corner(canvas)
 
         # Get additional shit
         forecast = get_forecast(latitude, longitude, tomorrow_api_key)
@@ -506,33 +472,20 @@ class MappyBoi(Dashboard):
         precip_x, precip_y = get_precipitation_data(forecast)
         graph_img = plot_time_data(precip_x, precip_y)
 
-        __black_white_image = MappyBoi.add_raining_soon_graph(
-            __black_white_image, graph_img
-        )
-        __black_white_image = MappyBoi.add_temp(__black_white_image, temp)
-        __black_white_image = MappyBoi.add_aqi(__black_white_image, aqi_status)
-        __black_white_image = MappyBoi.add_sunriseset(
-            __black_white_image, sunrise, sunset
-        )
-        __black_white_image = MappyBoi.add_iss_passtime(__black_white_image, passtimes)
-        # __black_white_image = MappyBoi.add_count_pages(__black_white_image)
-        __black_white_image, __red_white_image = MappyBoi.add_vaccination_progress_bar(
-            __black_white_image, __red_white_image
-        )
-        __black_white_image = MappyBoi.add_birthday(__black_white_image)
-        __red_white_image = MappyBoi.add_weather_icon(__red_white_image, weather_state)
-
-        # Subtract Red from Black
-        __black_white_image = subtract_top_from_bottom(
-            __black_white_image, __red_white_image
-        )
+        canvas = MappyBoi.add_raining_soon_graph(canvas, graph_img)
+        canvas = MappyBoi.add_temp(canvas, temp)
+        canvas = MappyBoi.add_aqi(canvas, aqi_status)
+        canvas = MappyBoi.add_sunriseset(canvas, sunrise, sunset)
+        canvas = MappyBoi.add_iss_passtime(canvas, passtimes)
+        # canvas = MappyBoi.add_count_pages(canvas)
+        canvas = MappyBoi.add_vaccination_progress_bar(canvas)
+        canvas = MappyBoi.add_birthday(canvas)
+        canvas = MappyBoi.add_weather_icon(canvas, weather_state)
 
         # rasterize it
-        __red_white_image = rasterize(__red_white_image)
+        canvas.rasterize(RED)
 
-        __black_white_image, __red_white_image = MappyBoi.add_train_departures(
-            __black_white_image, __red_white_image,
-            train_departures,
-        )
+        canvas = MappyBoi.add_train_departures(canvas, train_departures)
 
-        return __black_white_image, __red_white_image
+        logging.info(f"HTTP: {stats}")
+        return canvas
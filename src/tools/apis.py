@@ -7,6 +7,7 @@ from typing import List, Tuple
 import pytz
 import requests
 
+from .httpcache import http_cache
 from .utils import get_current_time, parse_datetime, beautify_time_string
 
 
@@ -31,11 +32,11 @@ def get_iss_passtime(lat: float, lon: float, alt: int=50) -> dict:
     """Returns the iss pass times at this location"""
     payload = {"lat": lat, "lon": lon, "alt": alt}
 
-    r = requests.get("http://api.open-notify.org/iss-pass.json", params=payload)
-    if r.status_code != 200:
-        logging.error(f"Bad response from weather forecasting service: {r.status_code}")
+    status, passes = http_cache.get("http://api.open-notify.org/iss-pass.json", json.loads, params=payload)
+    if status != 200:
+        logging.error(f"Bad response from weather forecasting service: {status}")
         return None
-    return r.json()
+    return passes
 
 
 def get_forecast(lat: float, lon: float, api_key: str) -> dict:
@@ -143,13 +144,17 @@ def get_sunrise_and_sunset(lat: float, lon: float) -> Tuple[datetime.datetime, d
         "Accept": "application/json",
     }
     try:
-        r = requests.get(url, headers=headers, params=querystring)
+        status, times = http_cache.get(url, _parse_sunrise_and_sunset, headers=headers, params=querystring)
     except Exception as e:
         return (None, None)
-    if r.status_code != 200:
-        logging.error("Bad response from sunrise-sunset service", r.status_code)
+    if status != 200:
+        logging.error("Bad response from sunrise-sunset service", status)
         return (None, None)
-    payload = r.json()
+    return times
+
+
+def _parse_sunrise_and_sunset(body: bytes) -> Tuple[datetime.datetime, datetime.datetime]:
+    payload = json.loads(body)
     sunrise = parse_datetime(payload["results"]["sunrise"])
     sunset = parse_datetime(payload["results"]["sunset"])
     return (sunrise, sunset)
@@ -211,17 +216,17 @@ def get_precipitation_data(payload) -> Tuple[list, list]:
 
 
 def get_web_graph_count_pages() -> int:
-    r = requests.get("https://api.jamesjarvis.io/countPages")
-    if r.status_code != 200:
+    status, count = http_cache.get("https://api.jamesjarvis.io/countPages", lambda body: json.loads(body)["countPages"])
+    if status != 200:
         return 0
-    return r.json()["countPages"]
+    return count
 
 
 def get_web_graph_count_links() -> int:
-    r = requests.get("https://api.jamesjarvis.io/countLinks")
-    if r.status_code != 200:
+    status, count = http_cache.get("https://api.jamesjarvis.io/countLinks", lambda body: json.loads(body)["countLinks"])
+    if status != 200:
         return 0
-    return r.json()["countLinks"]
+    return count
 
 
 def get_birthdays(birthdays) -> List[str]:
@@ -244,12 +249,12 @@ def get_vaccinations_first_dose() -> dict:
     """
     url = "https://api.coronavirus.data.gov.uk/v1/data?filters=areaName=United%2520Kingdom;areaType=overview&latestBy=cumPeopleVaccinatedFirstDoseByPublishDate&structure=%7B%22date%22:%22date%22,%22value%22:%22cumPeopleVaccinatedFirstDoseByPublishDate%22%7D&format=json&page=1"
     try:
-        r = requests.get(url)
+        status, dose = http_cache.get(url, _parse_vaccinations)
     except Exception as e:
         return None
-    if r.status_code != 200:
+    if status != 200:
         return None
-    return r.json()["data"][0]
+    return dose
 
 def get_vaccinations_second_dose() -> dict:
     """
@@ -259,12 +264,12 @@ def get_vaccinations_second_dose() -> dict:
     """
     url = "https://api.coronavirus.data.gov.uk/v1/data?filters=areaName=United%2520Kingdom;areaType=overview&latestBy=cumPeopleVaccinatedSecondDoseByPublishDate&structure=%7B%22date%22:%22date%22,%22value%22:%22cumPeopleVaccinatedSecondDoseByPublishDate%22%7D&format=json&page=1"
     try:
-        r = requests.get(url)
+        status, dose = http_cache.get(url, _parse_vaccinations)
     except Exception as e:
         return None
-    if r.status_code != 200:
+    if status != 200:
         return None
-    return r.json()["data"][0]
+    return dose
 
 def get_vaccinations_third_dose() -> dict:
     """
@@ -274,12 +279,16 @@ def get_vaccinations_third_dose() -> dict:
     """
     url = "https://api.coronavirus.data.gov.uk/v1/data?filters=areaName=United%2520Kingdom;areaType=overview&latestBy=cumPeopleVaccinatedThirdInjectionByPublishDate&structure=%7B%22date%22:%22date%22,%22value%22:%22cumPeopleVaccinatedThirdInjectionByPublishDate%22%7D&format=json&page=1"
     try:
-        r = requests.get(url)
+        status, dose = http_cache.get(url, _parse_vaccinations)
     except Exception as e:
         return None
-    if r.status_code != 200:
+    if status != 200:
         return None
-    return r.json()["data"][0]
+    return dose
+
+def _parse_vaccinations(body: bytes) -> dict:
+    return json.loads(body)["data"][0]
+
 
 class Station:
     """
@@ -319,14 +328,18 @@ def beautify_station_name(name: str) -> str:
 def get_train_departure_times(username: str, password: str, station_code: str) -> List[Service]:
     url = f"https://api.rtt.io/api/v1/json/search/{station_code}"
     try:
-        r = requests.get(url, auth=(username, password))
+        status, services = http_cache.get(url, _parse_train_departures, auth=(username, password))
     except Exception as e:
         return None
-    if r.status_code != 200:
+    if status != 200:
         return None
+    return services
+
+
+def _parse_train_departures(body: bytes) -> List[Service]:
     return_services = []
     try:
-        services = r.json()["services"]
+        services = json.loads(body)["services"]
         if not services:
             return None
         for service in services:
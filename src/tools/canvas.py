@@ -0,0 +1,93 @@
+from typing import Callable, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .images import X_WIDTH, Y_HEIGHT, rasterize
+
+# Colours a tri-colour panel can show
+WHITE = "white"
+BLACK = "black"
+RED = "red"
+
+# Any ink at all, as a mask
+_TOUCHED = [0] + [255] * 255
+# Any pixel that is not white, as a mask
+_NOT_WHITE = [255] * 255 + [0]
+
+
+class Canvas:
+    """
+    Canvas holds a frame for a black/white/red panel as two 8 bit planes, one for black and one for
+    red, where 0 is full ink and 255 is white. Everything is drawn in one of the panel colours and
+    lands in the plane of that colour, while every pixel it touches is cleared from the other
+    plane, so the last thing drawn wins and black and red never overlap.
+    """
+
+    def __init__(self, size: Tuple[int, int] = (X_WIDTH, Y_HEIGHT)):
+        self.black = Image.new("L", size, 255)
+        self.red = Image.new("L", size, 255)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.black.size
+
+    def _planes(self, colour: str) -> Tuple[Image.Image, Image.Image]:
+        """The plane `colour` is drawn on and the one it is cleared from"""
+        if colour == BLACK:
+            return self.black, self.red
+        if colour == RED:
+            return self.red, self.black
+        raise ValueError(f"{colour} is not an ink colour")
+
+    def _paint(self, colour: str, shape: Callable[[ImageDraw.ImageDraw], None]):
+        """Draws `shape` in `colour`, `shape` being called to draw with fill 255 onto a coverage mask"""
+        coverage = Image.new("L", self.size, 0)
+        shape(ImageDraw.Draw(coverage))
+        if colour == WHITE:
+            self.black.paste(255, (0, 0), coverage)
+            self.red.paste(255, (0, 0), coverage)
+            return
+        plane, other = self._planes(colour)
+        plane.paste(0, (0, 0), coverage)
+        other.paste(255, (0, 0), coverage.point(_TOUCHED))
+
+    def rectangle(self, box, colour: str):
+        self._paint(colour, lambda draw: draw.rectangle(box, outline=None, fill=255))
+
+    def erase(self, box, colour: str):
+        """Whites out a rectangle of one colour only, leaving the other plane as it is"""
+        ImageDraw.Draw(self._planes(colour)[0]).rectangle(box, outline=None, fill=255)
+
+    def text(self, xy, text: str, font: ImageFont.FreeTypeFont, colour: str = BLACK):
+        self._paint(colour, lambda draw: draw.text(xy, text, 255, font=font))
+
+    def textsize(self, text: str, font: ImageFont.FreeTypeFont) -> Tuple[int, int]:
+        return ImageDraw.Draw(self.black).textsize(text, font=font)
+
+    def paste(self, image: Image.Image, xy=(0, 0), colour: str = BLACK, mask: Image.Image = None):
+        """
+        Pastes the grey levels of `image` into the plane of `colour`, dark being full ink, through
+        `mask` if given (an RGBA image works, its alpha is used). Whatever is not white in the
+        pasted area afterwards is cleared from the other plane.
+        """
+        ink = image if image.mode == "L" else image.convert("L")
+        box = (xy[0], xy[1], xy[0] + ink.size[0], xy[1] + ink.size[1])
+        plane, other = self._planes(colour)
+        plane.paste(ink, box, mask)
+        # Ink already in the box is not on the other plane anyway, so the whole box can be used
+        other.paste(255, box, plane.crop(box).point(_NOT_WHITE))
+
+    def rasterize(self, colour: str = RED):
+        """Lightens one colour by turning every other pixel of its plane white"""
+        if colour == RED:
+            self.red = rasterize(self.red)
+        else:
+            self.black = rasterize(self.black)
+
+    def getbuffers(self, epd) -> List[bytearray]:
+        """The black and the red framebuffer of the frame, packed by the panel driver"""
+        return [epd.getbuffer(self.black), epd.getbuffer(self.red)]
+
+    def images(self) -> Tuple[Image.Image, Image.Image]:
+        """The black/white and red/white images of the frame, as the dashboards used to build them"""
+        return self.black.convert("RGB"), self.red.convert("RGB")
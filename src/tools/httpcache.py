@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+import requests
+
+# Where responses are kept, relative to the working directory like the rest of the scripts' files
+HTTP_CACHE_DIR = os.path.join("temp", "http")
+
+
+class HTTPStats:
+    """Counts of the requests made, how many were conditional, and what the 304s saved"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.conditional = 0
+        self.not_modified = 0
+        self.bytes_saved = 0
+
+    def record(self, conditional: bool, not_modified: bool = False, saved: int = 0):
+        with self._lock:
+            self.requests += 1
+            self.conditional += conditional
+            self.not_modified += not_modified
+            self.bytes_saved += saved
+
+    def __str__(self) -> str:
+        rate = self.not_modified / self.conditional if self.conditional else 0.0
+        return (
+            f"{self.requests} requests, {self.not_modified} of {self.conditional} conditional ones "
+            f"not modified ({rate:.0%}), {self.bytes_saved} bytes saved"
+        )
+
+
+# Shared by everything that revalidates, so a run can report on all of it at once
+stats = HTTPStats()
+
+
+def conditional_headers(validators: dict) -> dict:
+    """The If-None-Match / If-Modified-Since headers for the ETag and Last-Modified of a response"""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def validators(response: requests.Response) -> dict:
+    """The ETag and Last-Modified a response came with, empty if it had neither"""
+    found = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    return {name: value for name, value in found.items() if value}
+
+
+def write_atomic(path: str, data: bytes):
+    """Writes next to `path` and renames over it, so readers never see half a file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class HTTPCache:
+    """
+    HTTPCache makes GET requests conditional. A response that came with an ETag or Last-Modified
+    is kept on disk with them, and the next request for the same URL sends them back. On a 304
+    the kept body is used instead, and parsed results are remembered for as long as the process
+    runs, so a long running one does not even parse it again.
+    """
+
+    def __init__(self, root: str = HTTP_CACHE_DIR, stats: HTTPStats = stats):
+        self.root = root
+        self.stats = stats
+        self._parsed = {}
+
+    def _paths(self, url: str, params) -> Tuple[str, str]:
+        # The query goes into the key but not into the name, it may hold an api key
+        key = requests.Request("GET", url, params=params).prepare().url
+        name = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.root, name), os.path.join(self.root, f"{name}.json")
+
+    def get(self, url: str, parse: Callable[[bytes], Any] = None, session=requests, **kwargs) -> Tuple[int, Optional[Any]]:
+        """
+        GETs `url` with the keyword arguments of requests.get. Returns the status code and the body
+        run through `parse` (the raw body without one), None for anything but a 200. A 304 counts
+        as a 200 with the kept body. Exceptions from requests and `parse` are left to the caller.
+        """
+        body_path, meta_path = self._paths(url, kwargs.get("params"))
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if not os.path.exists(body_path):
+            meta = {}
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.update(conditional_headers(meta))
+        r = session.get(url, headers=headers, **kwargs)
+
+        if r.status_code == 304 and meta:
+            self.stats.record(True, True, meta["size"])
+            parsed = self._parsed.get(body_path)
+            if parsed is not None and parsed[0] == meta:
+                return 200, parsed[1]
+            with open(body_path, "rb") as f:
+                body = f.read()
+        else:
+            self.stats.record(bool(meta))
+            if r.status_code != 200:
+                return r.status_code, None
+            body = r.content
+            meta = validators(r)
+            if meta:
+                meta["size"] = len(body)
+                write_atomic(body_path, body)
+                write_atomic(meta_path, json.dumps(meta).encode())
+
+        result = parse(body) if parse else body
+        if meta:
+            self._parsed[body_path] = (meta, result)
+        return 200, result
+
+
+http_cache = HTTPCache()
@@ -1,3 +1,6 @@
+from functools import lru_cache
+
+import numpy as np
 from PIL import Image
 from random import random
 
@@ -5,81 +8,77 @@ X_WIDTH = 880
 Y_HEIGHT = 528
 
 
+WHITE = (255, 255, 255)
+BLACK = (0, 0, 0)
+RED = (200, 0, 0)
+
+
+def _ink(mode: str, colour: tuple) -> np.ndarray:
+    """The pixel an RGB tuple is stored as in this mode, e.g. RGBA gets an opaque alpha and L its red"""
+    ink = Image.new(mode, (1, 1))
+    ink.putdata([colour if len(ink.getbands()) > 1 else colour[0]])
+    return np.asarray(ink)[0, 0]
+
+
+def _from_array(mode: str, pixels: np.ndarray) -> Image.Image:
+    """Builds an image from a height x width x bands array of bytes"""
+    return Image.frombytes(mode, (pixels.shape[1], pixels.shape[0]), pixels.tobytes())
+
+
+@lru_cache(maxsize=4)
+def _raster_mask(width: int, height: int) -> np.ndarray:
+    """Which pixels rasterize turns white, as a flat array in row order"""
+    index = np.arange(width * height)
+    # The pattern flips after every pixel but the first of each row, so it is the parity of
+    # the pixels seen so far less the rows started
+    mask = (index - (index + width - 1) // width) % 2 == 1
+    mask.setflags(write=False)
+    return mask
+
+
 def to_bitmap(image:  Image.Image, threshold: int) ->  Image.Image:
-    """This converts any PNG with alpha channels into a binary bitmap based on the transparency threshold"""
-    pixels = list(image.getdata())
-
-    # convert data list to contain only black or white
-    newPixels = []
-    for i, pixel in enumerate(pixels):
-        # if above certain transparency, turn white
-        if pixel[3] <= threshold:
-            newPixel = (255, 255, 255)
-        # if not transparent, convert to black
-        else:
-            newPixel = (0, 0, 0)
-        
-        newPixels.append(newPixel)
-
-    # create a image and put data into it
-    newImg = Image.new(image.mode, image.size)
-    newImg.putdata(newPixels)
-    return newImg
+    """
+    This converts any PNG with alpha channels into a binary bitmap based on the transparency threshold.
+    A single band image is taken to be the alpha channel on its own.
+    """
+    if len(image.getbands()) == 1:
+        # A lookup on the one band, without going through arrays of the whole frame
+        return image.point([255 if alpha <= threshold else 0 for alpha in range(256)])
+    alpha = np.asarray(image)[:, :, 3]
+
+    # if above certain transparency, turn white, if not transparent, convert to black
+    pixels = np.where((alpha <= threshold)[:, :, None], _ink(image.mode, WHITE), _ink(image.mode, BLACK))
+
+    return _from_array(image.mode, pixels)
 
 
 def rasterize(image: Image.Image) -> Image.Image:
     """This converts any PNG into a rasterized version of itself"""
-    pixels = list(image.getdata())
-    flip_this_one = False
-    H_SIZE = image.size[0]
-
-    # convert data list to contain only black or white
-    newPixels = []
-    for i, pixel in enumerate(pixels):
-        # Our "rasterising" is literally just turning the diagonal pixels white.
-        if flip_this_one:
-            pixel = (255, 255, 255)
-        
-        newPixels.append(pixel)
-        if i % H_SIZE != 0:
-            flip_this_one = not flip_this_one
-
-    # create a image and put data into it
-    newImg = Image.new(image.mode, image.size)
-    newImg.putdata(newPixels)
-    return newImg
+    pixels = np.array(image)
+    width, height = image.size
+
+    # Our "rasterising" is literally just turning the diagonal pixels white.
+    pixels.reshape(width * height, -1)[_raster_mask(width, height)] = _ink(image.mode, WHITE)
+
+    return _from_array(image.mode, pixels)
 
 
 def to_black_and_red_image(bw_image: Image.Image, rw_image: Image.Image) -> Image.Image:
     """This is really just to be used for dev, as it converts two images into a single one which the display cannot support"""
-    bw_pixels = list(bw_image.getdata())
-    rw_pixels = list(rw_image.getdata())
+    bw = np.asarray(bw_image)[:, :, 0]
+    rw = np.asarray(rw_image)[:, :, 0]
 
-    newPixels = []
-    for i in range(len(bw_pixels)):
-        if rw_pixels[i][0] == 0:
-            newPixel = (200, 0, 0)
-        elif bw_pixels[i][0] < 120:
-            newPixel = (0, 0, 0)
-        else:
-            newPixel = (255, 255, 255)
-        newPixels.append(newPixel)
+    pixels = np.where((bw < 120)[:, :, None], _ink(bw_image.mode, BLACK), _ink(bw_image.mode, WHITE))
+    # red wins over black
+    pixels[rw == 0] = _ink(bw_image.mode, RED)
 
-    # create a image and put data into it
-    newImg = Image.new(bw_image.mode, bw_image.size)
-    newImg.putdata(newPixels)
-    return newImg
+    return _from_array(bw_image.mode, pixels)
 
 
 def subtract_top_from_bottom(bottomimg:  Image.Image, topimg:  Image.Image) ->  Image.Image:
     """Any pixels that are not white in the top layer are removed from the bottom layer"""
-    bottompixels = list(bottomimg.getdata())
-    toppixels = list(topimg.getdata())
-
-    for i, pixel in enumerate(toppixels):
-        if pixel[0] < 255:
-            bottompixels[i] = (255, 255, 255)
+    mask = topimg.getchannel(0).point(lambda value: 255 if value < 255 else 0)
 
-    # put data back in the image
-    bottomimg.putdata(bottompixels)
+    # paint white through the mask, in place
+    bottomimg.paste(tuple(int(v) for v in _ink(bottomimg.mode, WHITE)), mask=mask)
     return bottomimg
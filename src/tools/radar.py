@@ -0,0 +1,63 @@
+import datetime
+import logging
+import threading
+from typing import Callable
+
+from .tiles import get_update_time, next_update_time
+
+# Seconds after a frame is due before fetching it, so the provider has it everywhere
+PREFETCH_SLACK = 15
+# Seconds between tries at a frame that was not all there yet
+PREFETCH_RETRY_WAIT = 60
+
+
+class RadarPrefetcher:
+    """
+    RadarPrefetcher fetches every radar frame into the tile cache as soon as it comes out, so that
+    drawing the map finds the radar on disk. `prefetch` fetches the tiles of the latest frame and
+    returns how many it could not get, it is tried again every PREFETCH_RETRY_WAIT seconds until
+    it gets them all or the next frame is out.
+    """
+
+    def __init__(self, prefetch: Callable[[], int], slack: float = PREFETCH_SLACK, retry_wait: float = PREFETCH_RETRY_WAIT):
+        self.prefetch = prefetch
+        self.slack = slack
+        self.retry_wait = retry_wait
+        self._stop = threading.Event()
+        self._thread = None
+
+    def fetch(self) -> int:
+        """Fetches the latest frame now, returns how many of its tiles are still missing, -1 if it failed"""
+        frame = get_update_time()
+        try:
+            missing = self.prefetch()
+        except Exception as e:
+            logging.exception(f"prefetch of the {frame:%H:%M} radar failed: {e}")
+            return -1
+        if missing:
+            logging.info(f"radar for {frame:%H:%M} prefetched, {missing} tiles not out yet")
+        else:
+            logging.info(f"radar for {frame:%H:%M} prefetched")
+        return missing
+
+    def run(self):
+        """Prefetches every frame as it comes out, until stop() is called"""
+        while not self._stop.is_set():
+            missing = self.fetch()
+            wait = (next_update_time() - datetime.datetime.utcnow()).total_seconds() + self.slack
+            if missing:
+                wait = min(wait, self.retry_wait)
+            self._stop.wait(max(wait, 0))
+
+    def start(self) -> threading.Thread:
+        """Runs the prefetcher in a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="radar-prefetch", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,104 @@
+import json
+import logging
+import os
+import time
+from typing import Optional, Tuple
+
+from .httpcache import write_atomic
+
+# Where tiles are kept, relative to the working directory like the rest of the scripts' files
+TILE_CACHE_DIR = os.path.join("temp", "tiles")
+# Most the cache may hold on disk before the least recently used tiles go
+TILE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class TileCache:
+    """
+    TileCache keeps downloaded map tiles on disk, one file per tile under
+    `root/<provider>/<zoom>/<x>/<y>[_<stamp>]`, the stamp being the publish time of layers that
+    change, and the tiles made from them under `root/derived`. A tile's modification time is when it was written, which is what `max_age` is checked
+    against, and its access time is bumped on every hit, which is what eviction goes by. The ETag
+    and Last-Modified a tile was served with are kept next to it in `<path>.http`. Expired tiles
+    are only ever removed by eviction, they are revalidated with those, and still drawn when the
+    server cannot be reached.
+    """
+
+    def __init__(self, root: str = TILE_CACHE_DIR, max_bytes: int = TILE_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, provider: str, zoom: int, x: int, y: int, stamp: str = None) -> str:
+        name = f"{y}_{stamp}" if stamp else f"{y}"
+        return os.path.join(self.root, provider, str(zoom), str(x), name)
+
+    def derived_path(self, digest: str, size: int, mode: str) -> str:
+        """Where a tile prepared for drawing is kept, by the hash of the tile it was made from"""
+        return os.path.join(self.root, "derived", digest[:2], f"{digest}_{size}_{mode}")
+
+    def get(self, path: str, max_age: float = None) -> Optional[bytes]:
+        """The tile stored at `path`, None if there is none or it is older than `max_age` seconds"""
+        try:
+            stat = os.stat(path)
+            if max_age is not None and time.time() - stat.st_mtime > max_age:
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            # Recently used, but keep the time it was written
+            os.utime(path, (time.time(), stat.st_mtime))
+            return data
+        except OSError:
+            return None
+
+    def validators(self, path: str) -> dict:
+        """The ETag and Last-Modified the tile at `path` was served with, empty if there are none"""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(f"{path}.http") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def put(self, path: str, data: bytes, validators: dict = None):
+        """Stores a tile, along with the ETag and Last-Modified it was served with if given"""
+        write_atomic(path, data)
+        if validators:
+            write_atomic(f"{path}.http", json.dumps(validators).encode())
+        elif os.path.exists(f"{path}.http"):
+            os.remove(f"{path}.http")
+
+    def revalidated(self, path: str) -> Optional[bytes]:
+        """The tile at `path`, made fresh again after the server said it has not changed"""
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return self.get(path)
+
+    def _entries(self):
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    yield path, os.stat(path)
+                except OSError:
+                    pass
+
+    def evict(self) -> Tuple[int, int]:
+        """Removes the least recently used tiles until the cache fits in `max_bytes`, returns (tiles, bytes) removed"""
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_atime)
+        total = sum(stat.st_size for _, stat in entries)
+        removed = 0
+        freed = 0
+        for path, stat in entries:
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            freed += stat.st_size
+        if removed:
+            logging.info(f"tile cache over {self.max_bytes} bytes, evicted {removed} tiles ({freed} bytes)")
+        return removed, freed
@@ -1,91 +1,318 @@
 import datetime
+import hashlib
 import logging
 import math
-import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from typing import Tuple
+from typing import Callable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
 
-import numpy as np
 import requests
 from PIL import Image
 
+from .httpcache import conditional_headers, stats, validators
+from .tilecache import TileCache
+
 TILE_DIMENSION = 256
+# Size every tile is scaled to in the 3x5 grid
+GRID_TILE_SIZE = 176
+# Tiles in the 3x5 grid, what the viewport's savings are counted against
+GRID_TILES = 3 * 5
+# Tiles downloaded at once, which is also the connections kept open per host
+TILE_WORKERS = 6
+# Seconds to connect to a tile server, and to wait for it to answer
+TILE_TIMEOUT = (5, 15)
+# Tries at a tile before its cell is left blank, with the wait between them doubling
+TILE_ATTEMPTS = 3
+TILE_RETRY_WAIT = 0.5
+# How often a new radar frame is published, and how long after its time it can be had
+RADAR_INTERVAL = datetime.timedelta(minutes=10)
+RADAR_DELAY = datetime.timedelta(minutes=10)
+# Longest a radar tile is reused for, even if the publish time it was fetched for is still current
+RADAR_MAX_AGE = 30 * 60
+# How often base map tiles are checked for changes, which costs a 304 when they have none
+BASE_MAX_AGE = 7 * 24 * 60 * 60
 
+tile_cache = TileCache()
 
-def get_update_time() -> datetime:
-    current_time = datetime.datetime.utcnow().replace(microsecond=0, second=0)
-    current_time = current_time - datetime.timedelta(
-        minutes=10
-    )
+# What an empty cell of the grid is filled with, per mode a layer can be stitched in
+BLANK = {"RGBA": (255, 255, 255, 0), "L": 255, "A": 0}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_update_time(now: datetime.datetime = None) -> datetime.datetime:
+    """The time of the latest radar frame out at `now` (UTC, default the current time)"""
+    current_time = (now or datetime.datetime.utcnow()).replace(microsecond=0, second=0)
+    current_time = current_time - RADAR_DELAY
     current_time = current_time - datetime.timedelta(
-        minutes=(current_time.minute % 10)
+        minutes=(current_time.minute % (RADAR_INTERVAL.seconds // 60))
     )
     return current_time
 
 
+def next_update_time(now: datetime.datetime = None) -> datetime.datetime:
+    """When (UTC) the radar frame after the latest one at `now` comes out"""
+    return get_update_time(now) + RADAR_INTERVAL + RADAR_DELAY
+
+
 def generate_base_map(zoom: int, xtile: int, ytile: int, api_key: str=None) -> str:
     return f"http://a.tile.stamen.com/toner/{zoom}/{xtile}/{ytile}.png"
 
 
-def generate_weather_map(zoom: int, xtile: int, ytile: int, api_key: str=None) -> str:
-    current_time = get_update_time()
+def generate_weather_map(zoom: int, xtile: int, ytile: int, api_key: str=None, when: datetime.datetime=None) -> str:
+    current_time = when or get_update_time()
     return f"https://sat.owm.io/maps/2.0/radar/{zoom}/{xtile}/{ytile}?appid={api_key}&day={current_time.strftime('%Y-%m-%dT%H:%M')}"
 
 
-def generate_metoffice_map(zoom: int, xtile: int, ytile: int, api_key: str=None) -> str:
-    current_time = get_update_time()
+def generate_metoffice_map(zoom: int, xtile: int, ytile: int, api_key: str=None, when: datetime.datetime=None) -> str:
+    current_time = when or get_update_time()
     return f"https://www.metoffice.gov.uk/public/data/LayerCache/OBSERVATIONS/ItemBbox/RADAR_UK_Composite_Highres/{xtile}/{ytile}/{zoom}/png?TIME={current_time.isoformat()}Z"
 
 
-def deg2num(lat_deg: float, lon_deg: float, zoom: int) -> Tuple[int, int]:
+def deg2frac(lat_deg: float, lon_deg: float, zoom: int) -> Tuple[float, float]:
+    """Where a location is in the tiles of `zoom`, the whole part being the tile and the rest the way into it"""
     lat_rad = math.radians(lat_deg)
     n = 2.0 ** zoom
-    xtile = int((lon_deg + 180.0) / 360.0 * n)
-    ytile = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    xtile = (lon_deg + 180.0) / 360.0 * n
+    ytile = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n
     return (xtile, ytile)
 
 
-def pil_grid(images, max_horiz=np.iinfo(int).max) ->  Image.Image:
-    n_images = len(images)
-    n_horiz = min(n_images, max_horiz)
-    h_sizes, v_sizes = [0] * n_horiz, [0] * (n_images // n_horiz)
-    for i, im in enumerate(images):
-        h, v = i % n_horiz, i // n_horiz
-        h_sizes[h] = max(h_sizes[h], im.size[0])
-        v_sizes[v] = max(v_sizes[v], im.size[1])
-    h_sizes, v_sizes = np.cumsum([0] + h_sizes), np.cumsum([0] + v_sizes)
-    im_grid = Image.new("RGBA", (h_sizes[-1], v_sizes[-1]), (255, 255, 255, 255))
-    for i, im in enumerate(images):
-        im_grid.paste(im, (h_sizes[i % n_horiz], v_sizes[i // n_horiz]))
-    return im_grid
-
-
-def generate_3x5_image(xtile: int, ytile: int, zoom: int, generate_url, api_key: str=None, cache: str=None) ->  Image.Image:
-    filepath = f"temp/{cache}_{xtile}_{ytile}_{zoom}.png"
-    if cache is not None and os.path.isfile(filepath):
-        return Image.open(filepath, mode="r")
-
-    image_arr = list()
-
-    y = -2
-    while y <= 2:
-        x = -1
-        while x <= 1:
-            # print(xtile + x, ytile + y)
-            r = requests.get(generate_url(zoom, xtile + x, ytile + y, api_key))
-            if r.status_code != 200:
-                logging.info(f"failed download!! code is {r.status_code}")
-            i = Image.open(BytesIO(r.content))
-            i = i.resize((176, 176), resample=Image.BICUBIC)
-            image_arr.append(i)
-            x += 1
-        y += 1
-
-    # we then want to combine these images in a 3 x 5 grid I guess?
-    bigboi = pil_grid(image_arr, 3)
-
-    if cache is not None and not os.path.isfile(filepath):
-        os.mkdir("temp")
-        bigboi.save(filepath)
-
-    return bigboi
+def deg2num(lat_deg: float, lon_deg: float, zoom: int) -> Tuple[int, int]:
+    xtile, ytile = deg2frac(lat_deg, lon_deg, zoom)
+    return (int(xtile), int(ytile))
+
+
+def _session(url: str) -> requests.Session:
+    """The keep-alive session for the host of `url`, shared by every download from it"""
+    host = urlsplit(url).netloc
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=TILE_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[host] = session
+    return session
+
+
+def fetch_tile(url: str, known: dict = None) -> Optional[requests.Response]:
+    """
+    Downloads one tile, conditionally if given the `known` validators of the copy at hand (see
+    httpcache.validators). Returns the 200 or 304 response, None if that failed TILE_ATTEMPTS times.
+    """
+    # Only the host and path are logged, the query holds the api key
+    name = "".join(urlsplit(url)[1:3])
+    headers = conditional_headers(known or {})
+    for attempt in range(1, TILE_ATTEMPTS + 1):
+        try:
+            r = _session(url).get(url, headers=headers, timeout=TILE_TIMEOUT)
+            if r.status_code == 200 or (r.status_code == 304 and headers):
+                return r
+            logging.info(f"failed download of {name}!! code is {r.status_code}")
+            # Only server trouble is worth another go
+            if r.status_code < 500 and r.status_code != 429:
+                return None
+        except requests.RequestException as e:
+            logging.info(f"failed download of {name}, attempt {attempt}: {e}")
+        if attempt < TILE_ATTEMPTS:
+            time.sleep(TILE_RETRY_WAIT * 2 ** (attempt - 1))
+    return None
+
+
+def prepare_tile(tile: Image.Image, mode: str) -> Image.Image:
+    """
+    Scales a tile to the grid and turns it into `mode`, "L" for its grey levels or "A" for its
+    alpha channel as an "L" image
+    """
+    tile = tile.resize((GRID_TILE_SIZE, GRID_TILE_SIZE), resample=Image.BICUBIC).convert("RGBA")
+    if mode == "A":
+        return tile.getchannel("A")
+    return tile.convert(mode)
+
+
+def _grid_tile(url: str, path: Optional[str], max_age: Optional[float], mode: str) -> Optional[Image.Image]:
+    data = tile_cache.get(path, max_age) if path else None
+    response = None
+    if data is None:
+        # An expired tile is asked after with what it was served with, and kept if unchanged
+        known = tile_cache.validators(path) if path else {}
+        response = fetch_tile(url, known)
+        if response is not None and response.status_code == 304:
+            data = tile_cache.revalidated(path)
+            stats.record(True, True, len(data or b""))
+            # Evicted in the meantime, so it has to come in full after all
+            response = None if data is not None else fetch_tile(url)
+        elif response is not None:
+            stats.record(bool(known))
+        if data is None and response is not None and response.status_code == 200:
+            data = response.content
+        elif data is None:
+            # Better an outdated tile than a blank cell
+            data = tile_cache.get(path) if path else None
+            if data is None:
+                return None
+            logging.info(f"could not refresh tile {path}, using the expired one")
+
+    # Tiles are scaled and converted once, then kept ready to be copied into the grid. Going by
+    # the hash shares them between places that look the same, like the empty radar tiles.
+    stored = "L" if mode == "A" else mode
+    derived_path = tile_cache.derived_path(hashlib.sha1(data).hexdigest(), GRID_TILE_SIZE, mode)
+    derived = tile_cache.get(derived_path)
+    if derived is not None and len(derived) == GRID_TILE_SIZE * GRID_TILE_SIZE * len(stored):
+        tile = Image.frombytes(stored, (GRID_TILE_SIZE, GRID_TILE_SIZE), derived)
+    else:
+        try:
+            tile = Image.open(BytesIO(data))
+            tile.load()
+        except OSError as e:
+            logging.info(f"unreadable tile {path or ''}: {e}")
+            return None
+        tile = prepare_tile(tile, mode)
+        tile_cache.put(derived_path, tile.tobytes())
+    # Saved whichever way the tile was prepared, a download whose scaled copy is already kept
+    # (like another empty radar tile) still has to be there for the next run and its revalidation
+    if response is not None and path:
+        tile_cache.put(path, data, validators(response))
+    return tile
+
+
+def _fetch_tiles(cells: List[Tuple[int, int]], zoom: int, generate_url, api_key: str, cache: str, max_age: float, frames: bool, mode: str, place: Callable[[int, Image.Image], None] = None) -> int:
+    """
+    Fetches the tiles at `cells`, handing each to `place` along with its index as soon as it is
+    ready, so only the tiles being worked on are held at any one time. Returns how many could
+    not be had.
+    """
+    # One publish time for the whole layer, so every URL and cache path is of the same frame even
+    # if the fetch runs past the next one
+    when = (get_update_time(),) if frames else ()
+    stamp = when[0].strftime("%Y%m%d%H%M") if frames else None
+    urls = [generate_url(zoom, x, y, api_key, *when) for x, y in cells]
+    paths = [tile_cache.path(cache, zoom, x, y, stamp) if cache else None for x, y in cells]
+    placing = threading.Lock()
+
+    def fetch(i: int) -> bool:
+        tile = _grid_tile(urls[i], paths[i], max_age, mode)
+        if tile is None:
+            return False
+        if place is not None:
+            with placing:
+                place(i, tile)
+        return True
+
+    with ThreadPoolExecutor(max_workers=TILE_WORKERS) as pool:
+        missing = sum(not found for found in pool.map(fetch, range(len(cells))))
+    tile_cache.evict()
+
+    # A tile that could not be had is left as a blank cell, white and see-through
+    if missing:
+        logging.warning(f"{missing} of {len(cells)} tiles missing, leaving them blank")
+    return missing
+
+
+def _blank(size: Tuple[int, int], mode: str) -> Image.Image:
+    return Image.new("L" if mode == "A" else mode, size, BLANK[mode])
+
+
+def generate_3x5_image(xtile: int, ytile: int, zoom: int, generate_url, api_key: str=None, cache: str=None, max_age: float=None, frames: bool=False, mode: str="RGBA") ->  Image.Image:
+    """
+    Stitches the 3x5 tiles around (xtile, ytile) together, in `mode` (see prepare_tile). With
+    `cache`, the name of the layer, tiles are kept on disk and reused, and checked for changes
+    once older than `max_age` seconds. Layers of `frames` change over time, their tiles are kept
+    per publish time (see get_update_time), which is worked out once and handed to `generate_url`
+    after `api_key`.
+    """
+    cells = [(xtile + x, ytile + y) for y in range(-2, 3) for x in range(-1, 2)]
+    grid = _blank((3 * GRID_TILE_SIZE, 5 * GRID_TILE_SIZE), mode)
+    _fetch_tiles(
+        cells, zoom, generate_url, api_key, cache, max_age, frames, mode,
+        lambda i, tile: grid.paste(tile, ((i % 3) * GRID_TILE_SIZE, (i // 3) * GRID_TILE_SIZE)),
+    )
+    return grid
+
+
+def _hidden(area: Tuple[int, int, int, int], boxes: Sequence[Tuple[int, int, int, int]]) -> bool:
+    """Whether `area`, right and bottom exclusive, lies entirely in one of `boxes`, given as drawn by ImageDraw.rectangle"""
+    left, top, right, bottom = area
+    return any(
+        box[0] <= left and box[1] <= top and right - 1 <= box[2] and bottom - 1 <= box[3]
+        for box in boxes
+    )
+
+
+def _snap(start: int, length: int) -> int:
+    """
+    The start nearest `start` from which `length` pixels cross no more tiles than they have to,
+    so the view never straddles a column or row of tiles more than a grid of its size would
+    """
+    slack = -length % GRID_TILE_SIZE
+    into = start % GRID_TILE_SIZE
+    if into <= slack:
+        return start
+    # Either back off until the far edge is in the last tile, or move on to the next tile
+    back = start - (into - slack)
+    on = start + GRID_TILE_SIZE - into
+    return back if start - back <= on - start else on
+
+
+def _viewport(lat: float, lon: float, zoom: int, size: Tuple[int, int], hidden: Sequence[Tuple[int, int, int, int]]) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """The tiles that show in the view and where each goes in the image"""
+    width, height = size
+    xfrac, yfrac = deg2frac(lat, lon, zoom)
+    # Where the top left corner of the image is on the plane of scaled tiles, as near to centred on
+    # the location as the tile boundaries allow
+    left = _snap(round(xfrac * GRID_TILE_SIZE) - width // 2, width)
+    top = _snap(round(yfrac * GRID_TILE_SIZE) - height // 2, height)
+
+    in_view = 0
+    cells = []
+    offsets = []
+    for y in range(top // GRID_TILE_SIZE, (top + height - 1) // GRID_TILE_SIZE + 1):
+        for x in range(left // GRID_TILE_SIZE, (left + width - 1) // GRID_TILE_SIZE + 1):
+            in_view += 1
+            offset = (x * GRID_TILE_SIZE - left, y * GRID_TILE_SIZE - top)
+            shown = (
+                max(offset[0], 0),
+                max(offset[1], 0),
+                min(offset[0] + GRID_TILE_SIZE, width),
+                min(offset[1] + GRID_TILE_SIZE, height),
+            )
+            if _hidden(shown, hidden):
+                continue
+            cells.append((x, y))
+            offsets.append(offset)
+    logging.info(
+        f"{len(cells)} tiles to fetch, {GRID_TILES - len(cells)} fewer than the 3x5 grid "
+        f"({in_view - len(cells)} of the {in_view} in view hidden)"
+    )
+    return cells, offsets
+
+
+def render_viewport(lat: float, lon: float, zoom: int, size: Tuple[int, int], generate_url, api_key: str=None, cache: str=None, max_age: float=None, frames: bool=False, mode: str="RGBA", hidden: Sequence[Tuple[int, int, int, int]]=()) -> Image.Image:
+    """
+    Draws a map of `size` pixels centred on (lat, lon) as near as can be without taking in more
+    tiles than a grid of that size, with the tiles scaled to GRID_TILE_SIZE. Only the tiles that
+    show are fetched, ones entirely behind one of the `hidden` boxes are left
+    blank. The other arguments are as for generate_3x5_image.
+    """
+    cells, offsets = _viewport(lat, lon, zoom, size, hidden)
+    image = _blank(size, mode)
+    _fetch_tiles(
+        cells, zoom, generate_url, api_key, cache, max_age, frames, mode,
+        lambda i, tile: image.paste(tile, offsets[i]),
+    )
+    return image
+
+
+def prefetch_viewport(lat: float, lon: float, zoom: int, size: Tuple[int, int], generate_url, api_key: str=None, cache: str=None, max_age: float=None, frames: bool=False, mode: str="RGBA", hidden: Sequence[Tuple[int, int, int, int]]=()) -> int:
+    """
+    Fetches the tiles render_viewport would draw with the same arguments into the tile cache,
+    without drawing them. Returns how many could not be had.
+    """
+    cells, _ = _viewport(lat, lon, zoom, size, hidden)
+    return _fetch_tiles(cells, zoom, generate_url, api_key, cache, max_age, frames, mode)
@@ -1,8 +1,10 @@
 from io import BytesIO
 from PIL import Image
 from datatypes import WeatherData, PointForecast, TrainData, Departure
+from httpcache import http_cache
 import requests
 import datetime
+import json
 import logging
 import pytz
 
@@ -194,13 +196,21 @@ def get_sunrise_and_sunset(
         "Accept": "application/json",
     }
     try:
-        r = requests.get(url, headers=headers, params=querystring)
+        status, times = http_cache.get(
+            url, _parse_sunrise_and_sunset, headers=headers, params=querystring
+        )
     except Exception as e:
         return (None, None)
-    if r.status_code != 200:
-        logging.error("Bad response from sunrise-sunset service", r.status_code)
+    if status != 200:
+        logging.error("Bad response from sunrise-sunset service", status)
         return (None, None)
-    payload = r.json()
+    return times
+
+
+def _parse_sunrise_and_sunset(
+    body: bytes,
+) -> tuple[datetime.datetime, datetime.datetime]:
+    payload = json.loads(body)
     sunrise = parse_datetime(payload["results"]["sunrise"])
     sunset = parse_datetime(payload["results"]["sunset"])
     return (sunrise, sunset)
@@ -227,18 +237,30 @@ def get_train_departure_times(
 ) -> TrainData:
     url = f"https://api.rtt.io/api/v1/json/search/{station_code}"
     try:
-        r = requests.get(url, auth=(username, password))
+        status, departures = http_cache.get(
+            url, _parse_departures, auth=(username, password)
+        )
     except Exception as e:
         logging.error("Exception encountered whilst fetching train info", exc_info=e)
         return TrainData(last_updated=None, departures=[])
-    if r.status_code != 200:
-        logging.error("Bad response from train times service", r.status_code)
+    if status != 200:
+        logging.error("Bad response from train times service", status)
+        return TrainData(last_updated=None, departures=[])
+    if departures is None:
         return TrainData(last_updated=None, departures=[])
+    return TrainData(
+        last_updated=datetime.datetime.utcnow(),
+        departures=departures,
+    )
+
+
+def _parse_departures(body: bytes) -> list[Departure]:
+    """The departures on a train board, None if it could not be made sense of"""
     departures = []
     try:
-        services = r.json()["services"]
+        services = json.loads(body)["services"]
         if not services:
-            return TrainData(last_updated=datetime.datetime.utcnow(), departures=[])
+            return []
         for service in services:
             if "locationDetail" not in service:
                 continue
@@ -271,8 +293,5 @@ def get_train_departure_times(
             departures.append(departure)
     except Exception as e:
         logging.warn("Failed to parse train times", e)
-        return TrainData(last_updated=None, departures=[])
-    return TrainData(
-        last_updated=datetime.datetime.utcnow(),
-        departures=departures,
-    )
+        return None
+    return departures
@@ -12,6 +12,8 @@ scp display.py $HOST:$HOST_LOCATION
 scp fonts.py $HOST:$HOST_LOCATION
 scp -r fonts $HOST:$HOST_LOCATION
 scp graphics.py $HOST:$HOST_LOCATION
+# A link to the dashboards' src/tools/httpcache.py, scp copies the file it points at
+scp httpcache.py $HOST:$HOST_LOCATION
 scp main.py $HOST:$HOST_LOCATION
 scp storage.py $HOST:$HOST_LOCATION
 scp settings.json $HOST:$HOST_LOCATION
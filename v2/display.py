@@ -9,6 +9,7 @@ import graphics
 import api
 import camera
 import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from storage import Storage
 
@@ -38,6 +39,14 @@ class Display:
         self.storage = storage
         self.last_redraw_time = None
         self._lock = threading.Lock()
+        # The LEDs are set from button presses, the main loop and the refresh thread
+        self._led_lock = threading.RLock()
+        # A single worker owns the panel, so frames are shown in order and one only goes out once
+        # the refresh before it has finished. At most one frame waits for it, a newer one replaces it.
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inky-refresh")
+        self._frame_lock = threading.Lock()
+        self._next_frame = None
+        self._refresh = None
 
         # Initialize the display setup explicitly so we can override settings
         self.inky_display.setup()
@@ -57,55 +66,71 @@ class Display:
         # B: Photo      (blue)
         # C: Photo      (blue)
         # D: Redraw     (error=red, no_error=blue)
-        self.inky_dev.set_led(0, 0, 5, 0)
-        self.inky_dev.set_led(1, 0, 0, 3)
-        self.inky_dev.set_led(2, 0, 0, 3)
-        if errored:
-            self.inky_dev.set_led(3, 5, 0, 0)
-        else:
-            self.inky_dev.set_led(3, 0, 0, 2)
-        self.inky_dev.update()
+        with self._led_lock:
+            self.inky_dev.set_led(0, 0, 5, 0)
+            self.inky_dev.set_led(1, 0, 0, 3)
+            self.inky_dev.set_led(2, 0, 0, 3)
+            if errored:
+                self.inky_dev.set_led(3, 5, 0, 0)
+            else:
+                self.inky_dev.set_led(3, 0, 0, 2)
+            self.inky_dev.update()
 
     def led_set_all(self, r, g, b, update=True):
         """
         set_all_leds sets all LED's to the given colour.
         """
-        self.inky_dev.set_led(0, r, g, b)
-        self.inky_dev.set_led(1, r, g, b)
-        self.inky_dev.set_led(2, r, g, b)
-        self.inky_dev.set_led(3, r, g, b)
-        if update:
-            self.inky_dev.update()
+        with self._led_lock:
+            self.inky_dev.set_led(0, r, g, b)
+            self.inky_dev.set_led(1, r, g, b)
+            self.inky_dev.set_led(2, r, g, b)
+            self.inky_dev.set_led(3, r, g, b)
+            if update:
+                self.inky_dev.update()
 
     def led_countdown_flash(self, countdown_seconds: float):
         """
         led_countdown_flash counts down for the provided seconds,
         then sets all LEDs to bright white as a "flash"
         """
-        for i in range(4, 0, -1):
-            self.led_set_all(0, 0, 0, update=False)
-            if i > 0:
-                self.inky_dev.set_led(0, 255, 255, 255)
-            if i > 1:
-                self.inky_dev.set_led(1, 255, 255, 255)
-            if i > 2:
-                self.inky_dev.set_led(2, 255, 255, 255)
-            if i > 3:
-                self.inky_dev.set_led(3, 255, 255, 255)
-            self.inky_dev.update()
-            sleep(countdown_seconds / 4)
-
-        # Camera flash, set to bright white
-        self.led_set_all(255, 255, 255)
+        with self._led_lock:
+            for i in range(4, 0, -1):
+                self.led_set_all(0, 0, 0, update=False)
+                if i > 0:
+                    self.inky_dev.set_led(0, 255, 255, 255)
+                if i > 1:
+                    self.inky_dev.set_led(1, 255, 255, 255)
+                if i > 2:
+                    self.inky_dev.set_led(2, 255, 255, 255)
+                if i > 3:
+                    self.inky_dev.set_led(3, 255, 255, 255)
+                self.inky_dev.update()
+                sleep(countdown_seconds / 4)
+
+            # Camera flash, set to bright white
+            self.led_set_all(255, 255, 255)
+
+    def read_buttons(self):
+        """
+        read_buttons returns the state of the four buttons and whether any changed, as
+        InkyDev.read_buttons does. It shares the bus with the LEDs, so it takes their lock.
+        """
+        with self._led_lock:
+            return self.inky_dev.read_buttons()
 
-    def redraw(self):
+    def redraw(self) -> Future:
         """
-        redraw redraws the display with the latest available information.
+        redraw renders the display with the latest available information, and hands the frame to
+        the refresh thread. It returns once the frame is queued, with a future that completes when
+        the panel has finished refreshing, so the next frame can be fetched and rendered meanwhile.
+        A frame still waiting for the refresh in progress is replaced rather than queued behind.
         """
         # Acquire lock to ensure we don't conflict with other threads (e.g. button presses)
         if not self._lock.acquire(blocking=False):
             logging.warning("Display redraw skipped - lock already held.")
-            return
+            skipped = Future()
+            skipped.set_result(None)
+            return skipped
 
         try:
             # Set all LEDs to a low blue colour to indicate a refresh is happening.
@@ -150,15 +175,44 @@ class Display:
             # Rotate to set back onto the display
             image = image.rotate(90, expand=True)
 
-            # Draw onto display.
-            logging.info("Beginning Display Redraw")
+            # Counted from when the frame is queued, so the main loop doesn't render another one
+            # while this one is still refreshing
+            self.last_redraw_time = datetime.datetime.utcnow()
+            with self._frame_lock:
+                if self._next_frame is not None:
+                    logging.info("Replacing the frame still waiting for the display")
+                    self._next_frame = image
+                    return self._refresh
+                self._next_frame = image
+                self._refresh = self._refresher.submit(self._show)
+                self._refresh.add_done_callback(self._shown)
+                return self._refresh
+        finally:
+            self._lock.release()
+
+    def _show(self):
+        """
+        _show puts the latest rendered frame on the display, blocking until the refresh has
+        finished. Only ever called on the refresh thread.
+        """
+        with self._frame_lock:
+            image, self._next_frame = self._next_frame, None
+        logging.info("Beginning Display Redraw")
 
-            self.inky_display.set_image(image, saturation=SATURATION)
-            self.inky_display.show()
+        self.inky_display.set_image(image, saturation=SATURATION)
+        self.inky_display.show()
 
-            logging.debug("Redraw complete")
+        logging.debug("Redraw complete")
 
+    def _shown(self, refresh: Future):
+        """
+        _shown resets the LEDs once a refresh is over, or flags the error if it failed.
+        """
+        error = refresh.exception()
+        if error is None:
             self.led_reset_to_default()
-            self.last_redraw_time = datetime.datetime.utcnow()
-        finally:
-            self._lock.release()
+            return
+        logging.error("error encountered while updating display", exc_info=error)
+        # Let the main loop try again on its next pass
+        self.last_redraw_time = None
+        self.led_reset_to_default(errored=True)
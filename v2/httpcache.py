@@ -0,0 +1 @@
+../src/tools/httpcache.py
\ No newline at end of file
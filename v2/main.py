@@ -23,6 +23,7 @@ from display import Display
 from storage import Storage
 import camera
 import api
+import httpcache
 
 GPIO.setmode(GPIO.BCM)
 GPIO.setup(PIN_INTERRUPT, GPIO.IN, pull_up_down=GPIO.PUD_UP)
@@ -59,7 +60,7 @@ def handle_interrupt(pin):
     handle_interrupt is called any time a button is pressed on the display.
     Handles user events.
     """
-    button_a, button_b, button_c, button_d, changed = display.inky_dev.read_buttons()
+    button_a, button_b, button_c, button_d, changed = display.read_buttons()
 
     if not changed:
         return
@@ -146,6 +147,7 @@ while True:
             station_code=settings["train_station"],
         )
         storage.set_train_data(train_data)
+        logging.info(f"HTTP: {httpcache.stats}")
     except Exception as e:
         logging.error("error encountered while updating train data", exc_info=e)
         display.led_reset_to_default(errored=True)
@@ -0,0 +1,39 @@
+import importlib
+
+# Panels by name, each driven by the epd<name> module. Nothing is imported, and no hardware is
+# touched, until a panel is asked for.
+PANELS = (
+    "1in02", "1in54", "1in54_V2", "1in54b", "1in54b_V2", "1in54c",
+    "2in13", "2in13_V2", "2in13b_V2", "2in13bc", "2in13d",
+    "2in7", "2in7b",
+    "2in9", "2in9b_V2", "2in9bc", "2in9d",
+    "4in2", "4in2bc",
+    "5in65f", "5in83", "5in83bc",
+    "7in5", "7in5_HD", "7in5_V2", "7in5b_HD", "7in5b_V3", "7in5bc", "7in5bc_V2",
+)
+
+DRIVERS = {name: __name__ + ".epd" + name for name in PANELS}
+
+
+def register(name, module):
+    """Adds a panel driven by `module`, the full name of a module with an EPD class"""
+    DRIVERS[name] = module
+
+
+def driver(name):
+    """The driver module of a panel, by its name with or without the "epd" prefix"""
+    if name not in DRIVERS and name.startswith("epd"):
+        name = name[3:]
+    try:
+        module = DRIVERS[name]
+    except KeyError:
+        raise ValueError("unknown panel %r" % name)
+    return importlib.import_module(module)
+
+
+def panel(name, backend=None):
+    """
+    An EPD for the panel `name`, talking through `backend` (see epdconfig.create) or through the
+    default backend, created the first time a panel uses it.
+    """
+    return driver(name).EPD(backend)
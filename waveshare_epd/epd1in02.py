@@ -30,19 +30,24 @@
 
 import logging
 from . import epdconfig
+from . import epdbase
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 80
 EPD_HEIGHT      = 128
 
-class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+class EPD(epdbase.EPDBase):
+    def __init__(self, backend=None):
+        self.backend = epdconfig if backend is None else backend
+        self.backend.set_controller('uc81xx')
+        self.reset_pin = self.backend.RST_PIN
+        self.dc_pin = self.backend.DC_PIN
+        self.busy_pin = self.backend.BUSY_PIN
+        self.cs_pin = self.backend.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.busy_ms = 0
     
     #full screen update LUT
 
@@ -89,103 +94,61 @@ class EPD:
         
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200) 
-        epdconfig.digital_write(self.reset_pin, 0)         # module reset
-        epdconfig.delay_ms(2)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200)   
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200) 
+        self.backend.digital_write(self.reset_pin, 0)         # module reset
+        self.backend.delay_ms(2)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200)   
 
-    def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
-
-    def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
-        
     def ReadBusy(self):
-        logging.debug("e-Paper busy")
-        self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        busy =not(busy & 0x01)
-        while(busy):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
-            busy =not(busy & 0x01)
-        epdconfig.delay_ms(800)
-        logging.debug("e-Paper busy release")        
+        self.busy_wait(1, poll=lambda: self.send_command(0x71), settle_ms=800)
 
     def TurnOnDisplay(self):
         self.send_command(0x12)
-        epdconfig.delay_ms(10)
+        self.backend.delay_ms(10)
         self.ReadBusy()
 
     def SetFulltReg(self):
-        self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w1[count]) 
-        
-        self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b1[count])     
+        self.send_sequence((
+            (0x23, self.lut_w1[:42]),
+            (0x24, self.lut_b1[:42]),
+        ))
 
     def SetPartReg(self):
-        self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w[count]) 
-        
-        self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b[count])     
+        self.send_sequence((
+            (0x23, self.lut_w[:42]),
+            (0x24, self.lut_b[:42]),
+        ))
 
     def Init(self):
-        if (epdconfig.module_init() != 0):
+        if (self.backend.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0xD2)			
-        self.send_data(0x3F)
-
-        self.send_command(0x00)  			
-        self.send_data (0x6F)  #from outside
-
-        self.send_command(0x01)  #power setting
-        self.send_data (0x03)	    
-        self.send_data (0x00)
-        self.send_data (0x2b)		
-        self.send_data (0x2b) 
-
-        self.send_command(0x06)  #Configuring the charge pump
-        self.send_data(0x3f)
-
-        self.send_command(0x2A)  #Setting XON and the options of LUT
-        self.send_data(0x00) 
-        self.send_data(0x00) 
-
-        self.send_command(0x30)  #Set the clock frequency
-        self.send_data(0x17) #50Hz
-
-        self.send_command(0x50)  #Set VCOM and data output interval
-        self.send_data(0x57)			
-
-        self.send_command(0x60)  #Set The non-overlapping period of Gate and Source.
-        self.send_data(0x22)
-
-        self.send_command(0x61)  #resolution setting
-        self.send_data (0x50)    #source 128 	 
-        self.send_data (0x80)       
-
-        self.send_command(0x82)  #sets VCOM_DC value
-        self.send_data(0x12)  #-1v
-
-        self.send_command(0xe3)#Set POWER SAVING
-        self.send_data(0x33)
+        self.send_sequence((
+            (0xD2, (0x3F,)),
+            (0x00, (
+                0x6F,  # from outside
+            )),
+            (0x01, (0x03, 0x00, 0x2b, 0x2b)),  # power setting
+            (0x06, (0x3f,)),  # Configuring the charge pump
+            (0x2A, (0x00, 0x00)),  # Setting XON and the options of LUT
+            (0x30, (  # Set the clock frequency
+                0x17,  # 50Hz
+            )),
+            (0x50, (0x57,)),  # Set VCOM and data output interval
+            (0x60, (0x22,)),  # Set The non-overlapping period of Gate and Source.
+            (0x61, (  # resolution setting
+                0x50,  # source 128
+                0x80,
+            )),
+            (0x82, (  # sets VCOM_DC value
+                0x12,  # -1v
+            )),
+            (0xe3, (0x33,)),  # Set POWER SAVING
+        ))
         self.SetFulltReg()	
         self.send_command(0x04)     		#power on
         self.ReadBusy()
@@ -195,39 +158,22 @@ class EPD:
     def Partial_Init(self):
         self.reset()
         
-        self.send_command(0xD2)
-        self.send_data(0x3F)
-
-        self.send_command(0x00)
-        self.send_data (0x6F)  #from outside
-
-        self.send_command(0x01)  #power setting
-        self.send_data (0x03)
-        self.send_data (0x00)
-        self.send_data (0x2b)
-        self.send_data (0x2b)
-
-        self.send_command(0x06)  #Configuring the charge pump
-        self.send_data(0x3f)
-
-        self.send_command(0x2A)  #Setting XON and the options of LUT
-        self.send_data(0x00)
-        self.send_data(0x00)
-
-        self.send_command(0x30)  #Set the clock frequency
-        self.send_data(0x17)
-
-        self.send_command(0x50)  #Set VCOM and data output interval
-        self.send_data(0xf2)
-
-        self.send_command(0x60)  #Set The non-overlapping period of Gate and Source.
-        self.send_data(0x22)
-
-        self.send_command(0x82)  #Set VCOM_DC value
-        self.send_data(0x12)#-1v
-
-        self.send_command(0xe3)#Set POWER SAVING
-        self.send_data(0x33)
+        self.send_sequence((
+            (0xD2, (0x3F,)),
+            (0x00, (
+                0x6F,  # from outside
+            )),
+            (0x01, (0x03, 0x00, 0x2b, 0x2b)),  # power setting
+            (0x06, (0x3f,)),  # Configuring the charge pump
+            (0x2A, (0x00, 0x00)),  # Setting XON and the options of LUT
+            (0x30, (0x17,)),  # Set the clock frequency
+            (0x50, (0xf2,)),  # Set VCOM and data output interval
+            (0x60, (0x22,)),  # Set The non-overlapping period of Gate and Source.
+            (0x82, (  # Set VCOM_DC value
+                0x12,  # -1v
+            )),
+            (0xe3, (0x33,)),  # Set POWER SAVING
+        ))
 
         self.SetPartReg()	
 
@@ -237,26 +183,7 @@ class EPD:
         return 0
     
     def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def Display(self, image):
         if (image == None):
@@ -268,14 +195,10 @@ class EPD:
             Width = self.width / 8 + 1
             
         self.send_command(0x10)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data2([0xff] * (int(Width) * self.height))
         
         self.send_command(0x13)
-        for j in range(0, self.height):
-            for i in range(0, int(Width)):
-                self.send_data(image[i + j * int(Width)])  
+        self.send_data2(image)
         self.TurnOnDisplay()
         
     def Clear(self):
@@ -288,14 +211,10 @@ class EPD:
         Height = self.height
         
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0x00)  
+        self.send_data2([0x00] * (int(Width) * Height))
         
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(0xff)  
+        self.send_data2([0xff] * (int(Width) * Height))
         self.TurnOnDisplay()
 
     def DisplayPartial(self, old_Image, Image):
@@ -319,14 +238,10 @@ class EPD:
         Height = self.height
         # send data
         self.send_command(0x10)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(old_Image[i + j * int(Width)])
+        self.send_data2(old_Image)
 
         self.send_command(0x13)
-        for j in range(0, Height):
-            for i in range(0, int(Width)):
-                self.send_data(Image[i + j * int(Width)])
+        self.send_data2(Image)
 
         # Set partial refresh
         self.TurnOnDisplay()
@@ -338,8 +253,8 @@ class EPD:
         self.ReadBusy()
         self.send_command(0x07)
         self.send_data(0xA5)
-        epdconfig.delay_ms(200)
-        epdconfig.module_exit()
+        self.backend.delay_ms(200)
+        self.backend.module_exit()
 
 ### END OF FILE ###
 
@@ -30,20 +30,26 @@
 
 import logging
 from . import epdconfig
+from . import epdbase
+from . import epdbuffer
 import numpy as np
+from PIL import Image
 
 # Display resolution
 EPD_WIDTH       = 122
 EPD_HEIGHT      = 250
 
-class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+class EPD(epdbase.EPDBase):
+    def __init__(self, backend=None):
+        self.backend = epdconfig if backend is None else backend
+        self.backend.set_controller('ssd16xx')
+        self.reset_pin = self.backend.RST_PIN
+        self.dc_pin = self.backend.DC_PIN
+        self.busy_pin = self.backend.BUSY_PIN
+        self.cs_pin = self.backend.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.busy_ms = 0
         
     FULL_UPDATE = 0
     PART_UPDATE = 1
@@ -85,28 +91,15 @@ class EPD:
         
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200) 
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(10)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200)   
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200) 
+        self.backend.digital_write(self.reset_pin, 0)
+        self.backend.delay_ms(10)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200)   
 
-    def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
-
-    def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
-        
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        self.busy_wait(0)
 
     def TurnOnDisplay(self):
         self.send_command(0x22)
@@ -121,7 +114,7 @@ class EPD:
         self.ReadBusy()
         
     def init(self, update):
-        if (epdconfig.module_init() != 0):
+        if (self.backend.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -130,57 +123,31 @@ class EPD:
             self.send_command(0x12) # soft reset
             self.ReadBusy()
 
-            self.send_command(0x74) #set analog block control
-            self.send_data(0x54)
-            self.send_command(0x7E) #set digital block control
-            self.send_data(0x3B)
-
-            self.send_command(0x01) #Driver output control
-            self.send_data(0xF9)
-            self.send_data(0x00)
-            self.send_data(0x00)
-
-            self.send_command(0x11) #data entry mode
-            self.send_data(0x01)
-
-            self.send_command(0x44) #set Ram-X address start/end position
-            self.send_data(0x00)
-            self.send_data(0x0F)    #0x0C-->(15+1)*8=128
-
-            self.send_command(0x45) #set Ram-Y address start/end position
-            self.send_data(0xF9)   #0xF9-->(249+1)=250
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            
-            self.send_command(0x3C) #BorderWavefrom
-            self.send_data(0x03)
-
-            self.send_command(0x2C)     #VCOM Voltage
-            self.send_data(0x55)    #
-
-            self.send_command(0x03)
-            self.send_data(self.lut_full_update[70])
-
-            self.send_command(0x04) #
-            self.send_data(self.lut_full_update[71])
-            self.send_data(self.lut_full_update[72])
-            self.send_data(self.lut_full_update[73])
-
-            self.send_command(0x3A)     #Dummy Line
-            self.send_data(self.lut_full_update[74])
-            self.send_command(0x3B)     #Gate time
-            self.send_data(self.lut_full_update[75])
-
-            self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
-
-            self.send_command(0x4E)   # set RAM x address count to 0
-            self.send_data(0x00)
-            self.send_command(0x4F)   # set RAM y address count to 0X127
-            self.send_data(0xF9)
-            self.send_data(0x00)
+            self.send_sequence((
+                (0x74, (0x54,)),  # set analog block control
+                (0x7E, (0x3B,)),  # set digital block control
+                (0x01, (0xF9, 0x00, 0x00)),  # Driver output control
+                (0x11, (0x01,)),  # data entry mode
+                (0x44, (  # set Ram-X address start/end position
+                    0x00,
+                    0x0F,  # 0x0C-->(15+1)*8=128
+                )),
+                (0x45, (  # set Ram-Y address start/end position
+                    0xF9,  # 0xF9-->(249+1)=250
+                    0x00,
+                    0x00,
+                    0x00,
+                )),
+                (0x3C, (0x03,)),  # BorderWavefrom
+                (0x2C, (0x55,)),  # VCOM Voltage
+                (0x03, (self.lut_full_update[70],)),
+                (0x04, (self.lut_full_update[71], self.lut_full_update[72], self.lut_full_update[73])),
+                (0x3A, (self.lut_full_update[74],)),  # Dummy Line
+                (0x3B, (self.lut_full_update[75],)),  # Gate time
+                (0x32, self.lut_full_update[:70]),
+                (0x4E, (0x00,)),  # set RAM x address count to 0
+                (0x4F, (0xF9, 0x00)),  # set RAM y address count to 0X127
+            ))
             self.ReadBusy()
         else:
             self.send_command(0x2C)     #VCOM Voltage
@@ -188,22 +155,12 @@ class EPD:
 
             self.ReadBusy()
 
-            self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
-
-            self.send_command(0x37)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x40)
-            self.send_data(0x00)
-            self.send_data(0x00)
-
-            self.send_command(0x22)
-            self.send_data(0xC0)
-            self.send_command(0x20)
+            self.send_sequence((
+                (0x32, self.lut_partial_update[:70]),
+                (0x37, (0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00)),
+                (0x22, (0xC0,)),
+                (0x20, ()),
+            ))
             self.ReadBusy()
 
             self.send_command(0x3C) #BorderWavefrom
@@ -211,33 +168,18 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-         
-        buf = [0xFF] * (linewidth * self.height)
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        
         if(imwidth == self.width and imheight == self.height):
             logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):                    
-                    if pixels[x, y] == 0:
-                        x = imwidth - x
-                        buf[int(x / 8) + y * linewidth] &= ~(0x80 >> (x % 8))
+            # Columns are mirrored and shifted one pixel into the padding byte
+            canvas = Image.new('1', (epdbuffer.linewidth(self.width) * 8, self.height), 1)
+            canvas.paste(image_monocolor.transpose(Image.FLIP_LEFT_RIGHT), (1, 0))
+            return epdbuffer.pack(canvas, self.width, self.height)
         elif(imwidth == self.height and imheight == self.width):
             logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        newy = imwidth - newy - 1
-                        buf[int(newx / 8) + newy*linewidth] &= ~(0x80 >> (y % 8))
-        return buf   
+            return epdbuffer.pack(image_monocolor.transpose(Image.TRANSPOSE), self.width, self.height)
+        return epdbuffer.blank(self.width, self.height)
         
         
     def display(self, image):
@@ -247,9 +189,7 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.send_data2(image)
         self.TurnOnDisplay()
         
     def displayPartial(self, image):
@@ -259,9 +199,7 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.send_data2(image)
                 
                 
         # self.send_command(0x26)
@@ -277,15 +215,11 @@ class EPD:
             linewidth = int(self.width/8) + 1
 
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
+        self.send_data2(image)
                 
                 
         self.send_command(0x26)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])  
+        self.send_data2(image)
         self.TurnOnDisplay()
     
     def Clear(self, color):
@@ -296,9 +230,7 @@ class EPD:
         # logging.debug(linewidth)
         
         self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(color)   
+        self.send_data2([color] * (linewidth * self.height))
         self.TurnOnDisplay()
 
     def sleep(self):
@@ -308,9 +240,9 @@ class EPD:
 
         self.send_command(0x10) #enter deep sleep
         self.send_data(0x01)
-        epdconfig.delay_ms(100)
+        self.backend.delay_ms(100)
 
-        epdconfig.module_exit()
+        self.backend.module_exit()
 
 ### END OF FILE ###
 
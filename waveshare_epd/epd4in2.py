@@ -30,8 +30,9 @@
 
 import logging
 from . import epdconfig
+from . import epdbase
+from . import epdbuffer
 from PIL import Image
-import RPi.GPIO as GPIO
 
 # Display resolution
 EPD_WIDTH       = 400
@@ -42,14 +43,17 @@ GRAY2  = 0xC0
 GRAY3  = 0x80 #gray
 GRAY4  = 0x00 #Blackest
 
-class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+class EPD(epdbase.EPDBase):
+    def __init__(self, backend=None):
+        self.backend = epdconfig if backend is None else backend
+        self.backend.set_controller('uc81xx')
+        self.reset_pin = self.backend.RST_PIN
+        self.dc_pin = self.backend.DC_PIN
+        self.busy_pin = self.backend.BUSY_PIN
+        self.cs_pin = self.backend.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.busy_ms = 0
         self.GRAY1  = GRAY1 #white
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
@@ -201,255 +205,144 @@ class EPD:
     
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200) 
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(10)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200)   
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200) 
+        self.backend.digital_write(self.reset_pin, 0)
+        self.backend.delay_ms(10)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200)   
 
-    def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
-
-    def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
-        
     def ReadBusy(self):
-        self.send_command(0x71)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)    
+        self.busy_wait(1, poll=lambda: self.send_command(0x71))
 
     def set_lut(self):
-        self.send_command(0x20)               # vcom
-        for count in range(0, 44):
-            self.send_data(self.lut_vcom0[count])
-            
-        self.send_command(0x21)         # ww --
-        for count in range(0, 42):
-            self.send_data(self.lut_ww[count])
-            
-        self.send_command(0x22)         # bw r
-        for count in range(0, 42):
-            self.send_data(self.lut_bw[count])
-            
-        self.send_command(0x23)         # wb w
-        for count in range(0, 42):
-            self.send_data(self.lut_bb[count])
-            
-        self.send_command(0x24)         # bb b
-        for count in range(0, 42):
-            self.send_data(self.lut_wb[count])
+        self.send_sequence((
+            (0x20, self.lut_vcom0[:44]),  # vcom
+            (0x21, self.lut_ww[:42]),  # ww --
+            (0x22, self.lut_bw[:42]),  # bw r
+            (0x23, self.lut_bb[:42]),  # wb w
+            (0x24, self.lut_wb[:42]),  # bb b
+        ))
 
 
     def Partial_SetLut(self):
-        self.send_command(0x20);
-        for count in range(0, 44):	     
-            self.send_data(self.EPD_4IN2_Partial_lut_vcom1[count])
-
-        self.send_command(0x21);
-        for count in range(0, 42):	     
-            self.send_data(self.EPD_4IN2_Partial_lut_ww1[count])
-        
-        self.send_command(0x22);
-        for count in range(0, 42):     
-            self.send_data(self.EPD_4IN2_Partial_lut_bw1[count])
-
-        self.send_command(0x23);
-        for count in range(0, 42):	     
-            self.send_data(self.EPD_4IN2_Partial_lut_wb1[count])
-
-        self.send_command(0x24);
-        for count in range(0, 42):	     
-            self.send_data(self.EPD_4IN2_Partial_lut_bb1[count])
+        self.send_sequence((
+            (0x20, self.EPD_4IN2_Partial_lut_vcom1[:44]),
+            (0x21, self.EPD_4IN2_Partial_lut_ww1[:42]),
+            (0x22, self.EPD_4IN2_Partial_lut_bw1[:42]),
+            (0x23, self.EPD_4IN2_Partial_lut_wb1[:42]),
+            (0x24, self.EPD_4IN2_Partial_lut_bb1[:42]),
+        ))
 
 
        
     def Gray_SetLut(self):
-        self.send_command(0x20)						#vcom
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_vcom[count]) 
-
-        self.send_command(0x21)						#red not use
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_ww[count]) 
-
-        self.send_command(0x22)							#bw r
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_bw[count]) 
-
-        self.send_command(0x23)							#wb w
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_wb[count]) 
-
-        self.send_command(0x24)                          #bb b
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_bb[count]) 
-
-        self.send_command(0x25)						#vcom
-        for count in range(0, 42):
-            self.send_data(self.EPD_4IN2_4Gray_lut_ww[count])
+        self.send_sequence((
+            (0x20, self.EPD_4IN2_4Gray_lut_vcom[:42]),  # vcom
+            (0x21, self.EPD_4IN2_4Gray_lut_ww[:42]),  # red not use
+            (0x22, self.EPD_4IN2_4Gray_lut_bw[:42]),  # bw r
+            (0x23, self.EPD_4IN2_4Gray_lut_wb[:42]),  # wb w
+            (0x24, self.EPD_4IN2_4Gray_lut_bb[:42]),  # bb b
+            (0x25, self.EPD_4IN2_4Gray_lut_ww[:42]),  # vcom
+        ))
       
     
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (self.backend.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01) # POWER SETTING
-        self.send_data(0x03) # VDS_EN, VDG_EN
-        self.send_data(0x00) # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b) # VDH
-        self.send_data(0x2b) # VDL
-        
-        self.send_command(0x06) # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
-        
-        self.send_command(0x04) # POWER_ON
+        self.send_sequence((
+            (0x01, (  # POWER SETTING
+                0x03,  # VDS_EN, VDG_EN
+                0x00,  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+                0x2b,  # VDH
+                0x2b,  # VDL
+            )),
+            (0x06, (0x17, 0x17, 0x17)),  # boost soft start
+            (0x04, ()),  # POWER_ON
+        ))
         self.ReadBusy()
         
-        self.send_command(0x00) # panel setting
-        self.send_data(0xbf) # KW-BF   KWR-AF  BWROTP 0f
-        self.send_data(0x0d)
-        
-        self.send_command(0x30) # PLL setting
-        self.send_data(0x3c) # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
-
-        self.send_command(0x61)	# resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90) # 128
-        self.send_data(0x01)		
-        self.send_data(0x2c)
-
-        self.send_command(0x82)	# vcom_DC setting
-        self.send_data(0x28)
-
-        self.send_command(0X50)	# VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x97) # 97white border 77black border		VBDF 17|D7 VBDW 97 VBDB 57		VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        self.send_sequence((
+            (0x00, (  # panel setting
+                0xbf,  # KW-BF   KWR-AF  BWROTP 0f
+                0x0d,
+            )),
+            (0x30, (  # PLL setting
+                0x3c,  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
+            )),
+            (0x61, (  # resolution setting
+                0x01,
+                0x90,  # 128
+                0x01,
+                0x2c,
+            )),
+            (0x82, (0x28,)),  # vcom_DC setting
+            (0X50, (  # VCOM AND DATA INTERVAL SETTING
+                0x97,  # 97white border 77black border		VBDF 17|D7 VBDW 97 VBDB 57		VBDF F7 VBDW 77 VBDB 37  VBDR B7
+            )),
+        ))
     
         self.set_lut()
         # EPD hardware init end
         return 0
         
     def Init_4Gray(self):
-        if (epdconfig.module_init() != 0):
+        if (self.backend.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01)			#POWER SETTING
-        self.send_data (0x03)
-        self.send_data (0x00)       #VGH=20V,VGL=-20V
-        self.send_data (0x2b)		#VDH=15V															 
-        self.send_data (0x2b)		#VDL=-15V
-        self.send_data (0x13)
-
-        self.send_command(0x06)         #booster soft start
-        self.send_data (0x17)		#A
-        self.send_data (0x17)		#B
-        self.send_data (0x17)		#C 
-
-        self.send_command(0x04)
+        self.send_sequence((
+            (0x01, (  # POWER SETTING
+                0x03,
+                0x00,  # VGH=20V,VGL=-20V
+                0x2b,  # VDH=15V
+                0x2b,  # VDL=-15V
+                0x13,
+            )),
+            (0x06, (  # booster soft start
+                0x17,  # A
+                0x17,  # B
+                0x17,  # C
+            )),
+            (0x04, ()),
+        ))
         self.ReadBusy()
 
-        self.send_command(0x00)			#panel setting
-        self.send_data(0x3f)		#KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x30)			#PLL setting
-        self.send_data (0x3c)      	#100hz 
-
-        self.send_command(0x61)			#resolution setting
-        self.send_data (0x01)		#400
-        self.send_data (0x90)     	 
-        self.send_data (0x01)		#300
-        self.send_data (0x2c)
-
-        self.send_command(0x82)			#vcom_DC setting
-        self.send_data (0x12)
-
-        self.send_command(0X50)			#VCOM AND DATA INTERVAL SETTING			
-        self.send_data(0x97)
+        self.send_sequence((
+            (0x00, (  # panel setting
+                0x3f,  # KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
+            )),
+            (0x30, (  # PLL setting
+                0x3c,  # 100hz
+            )),
+            (0x61, (  # resolution setting
+                0x01,  # 400
+                0x90,
+                0x01,  # 300
+                0x2c,
+            )),
+            (0x82, (0x12,)),  # vcom_DC setting
+            (0X50, (0x97,)),  # VCOM AND DATA INTERVAL SETTING
+        ))
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
         
-    def getbuffer_4Gray(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
-        image_monocolor = image.convert('L')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        i=0
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((x + (y * self.width))/4)] = ((pixels[x-3, y]&0xc0) | (pixels[x-2, y]&0xc0)>>2 | (pixels[x-1, y]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6)
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for x in range(imwidth):
-                for y in range(imheight):
-                    newx = y
-                    newy = x
-                    if(pixels[x, y] == 0xC0):
-                        pixels[x, y] = 0x80
-                    elif (pixels[x, y] == 0x80):
-                        pixels[x, y] = 0x40
-                    i= i+1
-                    if(i%4 == 0):
-                        buf[int((newx + (newy * self.width))/4)] = ((pixels[x, y-3]&0xc0) | (pixels[x, y-2]&0xc0)>>2 | (pixels[x, y-1]&0xc0)>>4 | (pixels[x, y]&0xc0)>>6) 
-        
-        return buf
+    def getbuffer_4Gray(self, image, dither=False):
+        return epdbuffer.getbuffer_4gray(image, self.width, self.height, dither)
 
     def display(self, image):
         self.send_command(0x92);	
         self.set_lut();
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(image[i])
+        self.send_data2(image)
             
         self.send_command(0x12) 
         self.ReadBusy()
@@ -474,114 +367,57 @@ class EPD:
         self.send_data (int(X_start/256));
         self.send_data (int(X_start%256));   #x-start    
         
-        self.send_data (int(X_end /256));		
-        self.send_data (int(X_end %256)-1);  #x-end
+        # The window ends are inclusive, the last column and row rather than the ones after them
+        self.send_data (int(X_end - 1) >> 8);
+        self.send_data (int(X_end - 1) & 0xFF);  #x-end
 
         self.send_data (int(Y_start/256));
         self.send_data (int(Y_start%256));   #y-start    
         
 
-        self.send_data (int(Y_end/256));		
-        self.send_data (int(Y_end%256)-1);  #y-end
+        self.send_data (int(Y_end - 1) >> 8);
+        self.send_data (int(Y_end - 1) & 0xFF);  #y-end
         self.send_data (0x28);	
 
-        self.send_command(0x10);	       #writes Old data to SRAM for programming
+        # Gather the rows of the window so each plane goes out in one transfer
+        window = bytearray()
         for j in range(0, int(Y_end - Y_start)):
-            for i in range(0, int(X_end/8) - int(X_start/8)):
-                self.send_data(Image[(Y_start + j)*Width + int(X_start/8) + i]);
+            start = (Y_start + j)*Width + int(X_start/8)
+            window += bytes(Image[start:start + int(X_end/8) - int(X_start/8)])
+
+        self.send_command(0x10);	       #writes Old data to SRAM for programming
+        self.send_data2(window)
             
         self.send_command(0x13);				 #writes New data to SRAM.
-        for j in range(0, int(Y_end - Y_start)):
-            for i in range(0, int(X_end/8) - int(X_start/8)):
-                self.send_data(~Image[(Y_start + j)*Width + int(X_start/8) + i]);
+        self.send_data2(epdbuffer.invert(window))
             
         self.send_command(0x12);		 #DISPLAY REFRESH 		             
-        epdconfig.delay_ms(200)    #The delay here is necessary, 200uS at least!!!     
+        self.backend.delay_ms(200)    #The delay here is necessary, 200uS at least!!!     
         self.ReadBusy()
 
 
     def display_4Gray(self, image):
         self.send_command(0x92);	
         self.set_lut();
+        # The high bit of every pixel goes to the old data RAM and the low bit to the new one
         self.send_command(0x10)
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):                   # EPD_WIDTH * EPD_HEIGHT / 4
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80): 
-                        temp3 |= 0x01  #gray1
-                    else: #0x40
-                        temp3 |= 0x00 #gray2
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x01 #gray1
-                    else :   #0x40
-                            temp3 |= 0x00	#gray2	
-                    if(j!=1 or k!=1):				
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
-            
-        self.send_command(0x13)	    
-               
-        for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):                #5808*4  46464
-            temp3=0
-            for j in range(0, 2):
-                temp1 = image[i*2+j]
-                for k in range(0, 2):
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):
-                        temp3 |= 0x01#white
-                    elif(temp2 == 0x00):
-                        temp3 |= 0x00  #black
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00  #gray1
-                    else: #0x40
-                        temp3 |= 0x01 #gray2
-                    temp3 <<= 1	
-                    
-                    temp1 <<= 2
-                    temp2 = temp1&0xC0 
-                    if(temp2 == 0xC0):  #white
-                        temp3 |= 0x01
-                    elif(temp2 == 0x00): #black
-                        temp3 |= 0x00
-                    elif(temp2 == 0x80):
-                        temp3 |= 0x00 #gray1
-                    else:    #0x40
-                            temp3 |= 0x01	#gray2
-                    if(j!=1 or k!=1):					
-                        temp3 <<= 1
-                    temp1 <<= 2
-            self.send_data(temp3)
+        self.send_data2(epdbuffer.plane(image, 1))
+
+        self.send_command(0x13)
+        self.send_data2(epdbuffer.plane(image, 0))
         
         self.Gray_SetLut()
         self.send_command(0x12)
-        epdconfig.delay_ms(200)
+        self.backend.delay_ms(200)
         self.ReadBusy()
         # pass
     
     def Clear(self):
         self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2([0xFF] * int(self.width * self.height / 8))
             
         self.send_command(0x12) 
         self.ReadBusy()
@@ -592,7 +428,7 @@ class EPD:
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
         
-        epdconfig.module_exit()
+        self.backend.module_exit()
         
 ### END OF FILE ###
 
@@ -31,19 +31,41 @@
 
 import logging
 from . import epdconfig
+from . import epdbase
+from . import epdbuffer
+from PIL import Image
 
 # Display resolution
 EPD_WIDTH       = 600
 EPD_HEIGHT      = 448
 
-class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+# The panel's colours as RGB, in the order of their 4-bit codes
+PALETTE = [
+    (0, 0, 0),          # BLACK
+    (255, 255, 255),    # WHITE
+    (0, 255, 0),        # GREEN
+    (0, 0, 255),        # BLUE
+    (255, 0, 0),        # RED
+    (255, 255, 0),      # YELLOW
+    (255, 128, 0),      # ORANGE
+]
+
+# PIL palettes hold 256 entries, the seven colours repeat to fill it and every entry maps back to its code
+_PALETTE_IMAGE = Image.new('P', (1, 1))
+_PALETTE_IMAGE.putpalette([value for i in range(256) for value in PALETTE[i % len(PALETTE)]])
+_PALETTE_INDEX = bytes(i % len(PALETTE) for i in range(256))
+
+class EPD(epdbase.EPDBase):
+    def __init__(self, backend=None):
+        self.backend = epdconfig if backend is None else backend
+        self.backend.set_controller('uc81xx')
+        self.reset_pin = self.backend.RST_PIN
+        self.dc_pin = self.backend.DC_PIN
+        self.busy_pin = self.backend.BUSY_PIN
+        self.cs_pin = self.backend.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.busy_ms = 0
         self.BLACK  = 0x000000   #   0000  BGR
         self.WHITE  = 0xffffff   #   0001
         self.GREEN  = 0x00ff00   #   0010
@@ -55,75 +77,40 @@ class EPD:
         
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(600) 
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(2)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200)
-
-    def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(600) 
+        self.backend.digital_write(self.reset_pin, 0)
+        self.backend.delay_ms(2)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200)
 
-    def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
-        
     def ReadBusyHigh(self):
-        logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
-        logging.debug("e-Paper busy release")
+        self.busy_wait(1)
         
     def ReadBusyLow(self):
-        logging.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
-        logging.debug("e-Paper busy release")
+        self.busy_wait(0)
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (self.backend.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
         
         self.ReadBusyHigh()
-        self.send_command(0x00)
-        self.send_data(0xEF)
-        self.send_data(0x08)
-        self.send_command(0x01)
-        self.send_data(0x37)
-        self.send_data(0x00)
-        self.send_data(0x23)
-        self.send_data(0x23)
-        self.send_command(0x03)
-        self.send_data(0x00)
-        self.send_command(0x06)
-        self.send_data(0xC7)
-        self.send_data(0xC7)
-        self.send_data(0x1D)
-        self.send_command(0x30)
-        self.send_data(0x3C)
-        self.send_command(0x40)
-        self.send_data(0x00)
-        self.send_command(0x50)
-        self.send_data(0x37)
-        self.send_command(0x60)
-        self.send_data(0x22)
-        self.send_command(0x61)
-        self.send_data(0x02)
-        self.send_data(0x58)
-        self.send_data(0x01)
-        self.send_data(0xC0)
-        self.send_command(0xE3)
-        self.send_data(0xAA)
+        self.send_sequence((
+            (0x00, (0xEF, 0x08)),
+            (0x01, (0x37, 0x00, 0x23, 0x23)),
+            (0x03, (0x00,)),
+            (0x06, (0xC7, 0xC7, 0x1D)),
+            (0x30, (0x3C,)),
+            (0x40, (0x00,)),
+            (0x50, (0x37,)),
+            (0x60, (0x22,)),
+            (0x61, (0x02, 0x58, 0x01, 0xC0)),
+            (0xE3, (0xAA,)),
+        ))
 	
-        epdconfig.delay_ms(100)
+        self.backend.delay_ms(100)
         self.send_command(0x50)
         self.send_data(0x37)
         
@@ -131,60 +118,13 @@ class EPD:
         return 0
 
     def getbuffer(self, image):
-        buf = [0x00] * int(self.width * self.height / 2)
-        image_monocolor = image.convert('RGB')#Picture mode conversion
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        logging.debug('imwidth = %d  imheight =  %d ',imwidth, imheight)
-        if(imwidth == self.width and imheight == self.height):
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    Add = int((x + y * self.width) / 2)
-                    Color = 0;
-                    if (pixels[x, y][0] == 0 and  pixels[x, y][1] == 0 and pixels[x, y][2] == 0):
-                        Color = 0
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 255 and pixels[x, y][2] == 255):
-                        Color = 1
-                    elif (pixels[x, y][0] == 0 and  pixels[x, y][1] == 255 and pixels[x, y][2] == 0):
-                        Color = 2
-                    elif (pixels[x, y][0] == 0 and  pixels[x, y][1] == 0 and pixels[x, y][2] == 255):
-                        Color = 3
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 0 and pixels[x, y][2] == 0):
-                        Color = 4
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 255 and pixels[x, y][2] == 0):
-                        Color = 5
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 128 and pixels[x, y][2] == 0):
-                        Color = 6
-                    
-                    data_t = buf[Add]&(~(0xF0 >> ((x % 2)*4)))
-                    buf[Add] = data_t | ((Color << 4) >> ((x % 2)*4));
-                        
-        elif(imwidth == self.height and imheight == self.width):
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1   
-                    Add = int((newx + newy*self.width) / 2)
-                    Color = 0;
-                    if (pixels[x, y][0] == 0 and  pixels[x, y][1] == 0 and pixels[x, y][2] == 0):
-                        Color = 0
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 255 and pixels[x, y][2] == 255):
-                        Color = 1
-                    elif (pixels[x, y][0] == 0 and  pixels[x, y][1] == 255 and pixels[x, y][2] == 0):
-                        Color = 2
-                    elif (pixels[x, y][0] == 0 and  pixels[x, y][1] == 0 and pixels[x, y][2] == 255):
-                        Color = 3
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 0 and pixels[x, y][2] == 0):
-                        Color = 4
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 255 and pixels[x, y][2] == 0):
-                        Color = 5
-                    elif (pixels[x, y][0] == 255 and  pixels[x, y][1] == 128 and pixels[x, y][2] == 0):
-                        Color = 6
-                    
-                    data_t = buf[Add]&(~(0xF0 >> ((newx % 2)*4)))
-                    buf[Add] = data_t | ((Color << 4) >> ((newx % 2)*4));
-        return buf
+        # One palette index per pixel, colours off the palette taking the nearest entry
+        panel = epdbuffer.orient(image, self.width, self.height, 'RGB')
+        if panel is None:
+            return bytearray(int(self.width * self.height / 2))
+        indices = panel.quantize(palette=_PALETTE_IMAGE, dither=Image.NONE).tobytes()
+        # Two pixels per byte, the left one in the high nibble
+        return epdbuffer.pack_4bpp(Image.frombytes('L', panel.size, indices.translate(_PALETTE_INDEX)))
 
     def display(self,image):
         self.send_command(0x61)#Set Resolution setting
@@ -193,16 +133,14 @@ class EPD:
         self.send_data(0x01)
         self.send_data(0xC0)
         self.send_command(0x10)
-        for i in range(0, int(EPD_HEIGHT)):
-            for j in range(0, int(EPD_WIDTH/2)):
-                self.send_data((image[j+(int(EPD_WIDTH/2)*i)]))
+        self.send_data2(image)
         self.send_command(0x04)#0x04
         self.ReadBusyHigh()
         self.send_command(0x12)#0x12
         self.ReadBusyHigh()
         self.send_command(0x02)  #0x02
         self.ReadBusyLow()
-        epdconfig.delay_ms(500)
+        self.backend.delay_ms(500)
         
     def Clear(self):
         self.send_command(0x61)#Set Resolution setting
@@ -211,9 +149,7 @@ class EPD:
         self.send_data(0x01)
         self.send_data(0xC0)
         self.send_command(0x10)
-        for i in range(0, int(EPD_HEIGHT)):
-            for j in range(0, int(EPD_WIDTH/2)):
-                self.send_data(0x11)
+        self.send_data2([0x11] * (int(EPD_WIDTH/2) * int(EPD_HEIGHT)))
         #BLACK   0x00    /// 0000
         #WHITE   0x11    /// 0001
         #GREEN   0x22    /// 0010
@@ -228,12 +164,12 @@ class EPD:
         self.ReadBusyHigh()
         self.send_command(0x02)  #0x02
         self.ReadBusyLow()
-        epdconfig.delay_ms(500)
+        self.backend.delay_ms(500)
 
     def sleep(self):
-        epdconfig.delay_ms(500)
+        self.backend.delay_ms(500)
         self.send_command(0x07) # DEEP_SLEEP
         self.send_data(0XA5)
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.module_exit()        
+        self.backend.digital_write(self.reset_pin, 0)
+        self.backend.module_exit()        
         
\ No newline at end of file
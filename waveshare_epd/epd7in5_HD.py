@@ -30,50 +30,39 @@
 
 import logging
 from . import epdconfig
+from . import epdbase
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 880
 EPD_HEIGHT      = 528
 
-class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+class EPD(epdbase.EPDBase):
+    def __init__(self, backend=None):
+        self.backend = epdconfig if backend is None else backend
+        self.backend.set_controller('ssd16xx')
+        self.reset_pin = self.backend.RST_PIN
+        self.dc_pin = self.backend.DC_PIN
+        self.busy_pin = self.backend.BUSY_PIN
+        self.cs_pin = self.backend.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.busy_ms = 0
     
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200) 
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(2)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(200)   
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200) 
+        self.backend.digital_write(self.reset_pin, 0)
+        self.backend.delay_ms(2)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(200)   
 
-    def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
-
-    def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
-        
     def ReadBusy(self):
-        logging.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
-        epdconfig.delay_ms(200)
+        self.busy_wait(0, settle_ms=200)
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (self.backend.module_init() != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -89,90 +78,53 @@ class EPD:
         self.send_data(0xf7);
         self.ReadBusy();
 
-        self.send_command(0x0C);  # Soft start setting
-        self.send_data(0xAE);
-        self.send_data(0xC7);
-        self.send_data(0xC3);
-        self.send_data(0xC0);
-        self.send_data(0x40); 
-
-
-        self.send_command(0x01);  # Set MUX as 527
-        self.send_data(0xAF);
-        self.send_data(0x02);
-        self.send_data(0x01);#0x01
-
-        self.send_command(0x11);  # Data entry mode      
-        self.send_data(0x01);
-
-        self.send_command(0x44); 
-        self.send_data(0x00); # RAM x address start at 0
-        self.send_data(0x00); 
-        self.send_data(0x6F); 
-        self.send_data(0x03); 
-        self.send_command(0x45); 
-        self.send_data(0xAF); 
-        self.send_data(0x02);
-        self.send_data(0x00); 
-        self.send_data(0x00);
-
-        self.send_command(0x3C); # VBD
-        self.send_data(0x05); # LUT1, for white
-
-        self.send_command(0x18);
-        self.send_data(0X80);
-
-
-        self.send_command(0x22);
-        self.send_data(0XB1); #Load Temperature and waveform setting.
-        self.send_command(0x20);
+        self.send_sequence((
+            (0x0C, (0xAE, 0xC7, 0xC3, 0xC0, 0x40)),  # Soft start setting
+            (0x01, (  # Set MUX as 527
+                0xAF,
+                0x02,
+                0x01,  # 0x01
+            )),
+            (0x11, (0x01,)),  # Data entry mode
+            (0x44, (
+                0x00,  # RAM x address start at 0
+                0x00,
+                0x6F,
+                0x03,
+            )),
+            (0x45, (0xAF, 0x02, 0x00, 0x00)),
+            (0x3C, (  # VBD
+                0x05,  # LUT1, for white
+            )),
+            (0x18, (0X80,)),
+            (0x22, (
+                0XB1,  # Load Temperature and waveform setting.
+            )),
+            (0x20, ()),
+        ))
         self.ReadBusy();
 
-        self.send_command(0x4E); # set RAM x address count to 0;
-        self.send_data(0x00);
-        self.send_data(0x00);
-        self.send_command(0x4F); 
-        self.send_data(0x00);
-        self.send_data(0x00);
+        self.send_sequence((
+            (0x4E, (0x00, 0x00)),  # set RAM x address count to 0;
+            (0x4F, (0x00, 0x00)),
+        ))
         # EPD hardware init end
         return 0
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logging.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
         
     def display(self, image):
         self.send_command(0x4F); 
         self.send_data(0x00);
         self.send_data(0x00);
         self.send_command(0x24);
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(image[i]);
+        self.send_data2(image)
                 
         self.send_command(0x22);
         self.send_data(0xF7);#Load LUT from MCU(0x32)
         self.send_command(0x20);
-        epdconfig.delay_ms(10);
+        self.backend.delay_ms(10);
         self.ReadBusy();
         
     def Clear(self):
@@ -180,23 +132,21 @@ class EPD:
         self.send_data(0x00);
         self.send_data(0x00);
         self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xff)
+        self.send_data2([0xff] * int(self.width * self.height / 8))
             
         self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xff)
+        self.send_data2([0xff] * int(self.width * self.height / 8))
                 
         self.send_command(0x22);
         self.send_data(0xF7);#Load LUT from MCU(0x32)
         self.send_command(0x20);
-        epdconfig.delay_ms(10);
+        self.backend.delay_ms(10);
         self.ReadBusy();
 
     def sleep(self):
         self.send_command(0x10);
         self.send_data(0x01);
         
-        epdconfig.module_exit()
+        self.backend.module_exit()
 ### END OF FILE ###
 
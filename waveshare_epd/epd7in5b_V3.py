@@ -31,51 +31,40 @@
 import logging
 
 from . import epdconfig
+from . import epdbase
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH = 880
 EPD_HEIGHT = 528
 
 
-class EPD:
-    def __init__(self):
-        self.reset_pin = epdconfig.RST_PIN
-        self.dc_pin = epdconfig.DC_PIN
-        self.busy_pin = epdconfig.BUSY_PIN
-        self.cs_pin = epdconfig.CS_PIN
+class EPD(epdbase.EPDBase, epdbuffer.ColourPanel):
+    def __init__(self, backend=None):
+        self.backend = epdconfig if backend is None else backend
+        self.backend.set_controller('ssd16xx')
+        self.reset_pin = self.backend.RST_PIN
+        self.dc_pin = self.backend.DC_PIN
+        self.busy_pin = self.backend.BUSY_PIN
+        self.cs_pin = self.backend.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.busy_ms = 0
 
     # Hardware reset
     def reset(self):
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(100)
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(4)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(100)
-
-    def send_command(self, command):
-        epdconfig.digital_write(self.dc_pin, 0)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([command])
-        epdconfig.digital_write(self.cs_pin, 1)
-
-    def send_data(self, data):
-        epdconfig.digital_write(self.dc_pin, 1)
-        epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.spi_writebyte([data])
-        epdconfig.digital_write(self.cs_pin, 1)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(100)
+        self.backend.digital_write(self.reset_pin, 0)
+        self.backend.delay_ms(4)
+        self.backend.digital_write(self.reset_pin, 1)
+        self.backend.delay_ms(100)
 
     def ReadBusy(self):
-        logging.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while busy == 1:
-            busy = epdconfig.digital_read(self.busy_pin)
-        epdconfig.delay_ms(100)
+        self.busy_wait(0, settle_ms=100)
 
     def init(self):
-        if epdconfig.module_init() != 0:
+        if self.backend.module_init() != 0:
             return -1
 
         self.reset()
@@ -97,85 +86,30 @@ class EPD:
         self.ReadBusy()
         # waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x0C)
-        # Soft start setting
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0x40)
-
-        self.send_command(0x01)
-        # Set MUX as 527
-        self.send_data(0xAF)
-        self.send_data(0x02)
-        self.send_data(0x01)
-
-        self.send_command(0x11)
-        # Data entry mode
-        self.send_data(0x01)
-
-        self.send_command(0x44)
-        self.send_data(0x00)
-        # RAM x address start at 0
-        self.send_data(0x00)
-        self.send_data(0x6F)
-        # RAM x address end at 36Fh -> 879
-        self.send_data(0x03)
-        self.send_command(0x45)
-        self.send_data(0xAF)
-        # RAM y address start at 20Fh;
-        self.send_data(0x02)
-        self.send_data(0x00)
-        # RAM y address end at 00h;
-        self.send_data(0x00)
-
-        self.send_command(0x3C)
-        # VBD
-        self.send_data(0x01)
-        # LUT1, for white
-
-        self.send_command(0x18)
-        self.send_data(0x80)
-        self.send_command(0x22)
-        self.send_data(0xB1)
-        # Load Temperature and waveform setting.
-        self.send_command(0x20)
+        self.send_sequence((
+            (0x0C, (0xAE, 0xC7, 0xC3, 0xC0, 0x40)),  # Soft start setting
+            (0x01, (0xAF, 0x02, 0x01)),  # Set MUX as 527
+            (0x11, (0x01,)),  # Data entry mode
+            (0x44, (0x00, 0x00, 0x6F, 0x03)),  # RAM x address start at 0, end at 36Fh -> 879
+            (0x45, (0xAF, 0x02, 0x00, 0x00)),  # RAM y address start at 20Fh, end at 00h
+            (0x3C, (0x01,)),  # VBD
+            # LUT1, for white
+            (0x18, (0x80,)),
+            (0x22, (0xB1,)),  # Load Temperature and waveform setting.
+            (0x20, ()),
+        ))
         self.ReadBusy()
         # waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x4E)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_command(0x4F)
-        self.send_data(0xAF)
-        self.send_data(0x02)
+        self.send_sequence((
+            (0x4E, (0x00, 0x00)),
+            (0x4F, (0xAF, 0x02)),
+        ))
 
         return 0
 
     def getbuffer(self, image):
-        # logging.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert("1")
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        logging.debug("imwidth = %d  imheight =  %d ", imwidth, imheight)
-        if imwidth == self.width and imheight == self.height:
-            logging.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logging.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
-        return buf
+        return epdbuffer.getbuffer(image, self.width, self.height)
 
     def display(self, imageblack, imagered):
         self.send_command(0x4F)
@@ -183,18 +117,16 @@ class EPD:
         self.send_data(0x02)  # Added since the C version of this file has it?
 
         self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imageblack[i])
+        self.send_data2(imageblack)
 
         self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imagered[i])
+        self.send_data2(epdbuffer.invert(imagered))
 
         self.send_command(0x22)
         self.send_data(0xC7)
         # Load LUT from MCU(0x32)
         self.send_command(0x20)
-        epdconfig.delay_ms(100)
+        self.backend.delay_ms(100)
         #!!!The delay here is necessary, 200uS at least!!!
         self.ReadBusy()
 
@@ -203,18 +135,16 @@ class EPD:
         self.send_data(0xAF)
 
         self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0xFF)
+        self.send_data2([0xFF] * int(self.width * self.height / 8))
 
         self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(0x00)
+        self.send_data2([0x00] * int(self.width * self.height / 8))
 
         self.send_command(0x22)
         self.send_data(0xC7)
         # Load LUT from MCU(0x32)
         self.send_command(0x20)
-        epdconfig.delay_ms(100)
+        self.backend.delay_ms(100)
         #!!!The delay here is necessary, 200uS at least!!!
         self.ReadBusy()
 
@@ -223,7 +153,7 @@ class EPD:
         # deep sleep
         self.send_data(0x01)
 
-        epdconfig.module_exit()
+        self.backend.module_exit()
 
 
 ### END OF FILE ###
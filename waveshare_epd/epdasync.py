@@ -0,0 +1,76 @@
+# /*****************************************************************************
+# * | File        :	  epdasync.py
+# * | Function    :   Refreshes a panel without blocking the caller
+# * | Info        :
+# *----------------
+# * | Info        :   The frame is uploaded straight away and the wait for the
+# * |                 refresh is left to a background thread.
+# ******************************************************************************
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncRefresh:
+    """
+    Shows frames on a panel without waiting for the refresh. display() and clear() upload in the
+    calling thread, through the driver's nowait() (see epdbase.EPDBase), and return a Future once
+    the refresh has started. The driver's wait() for it runs in a background thread, and the
+    Future resolves to the time spent on BUSY, in ms.
+
+    Every call that talks to the panel takes a lock and waits for the refresh in flight first, so
+    frames go out in order, a new upload never overlaps the last refresh, and the driver is only
+    used by one thread at a time. The driver's getbuffer() does not touch the bus and can be used
+    to render the next frame meanwhile.
+    """
+
+    def __init__(self, epd):
+        self.epd = epd
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="epd-refresh")
+        self._lock = threading.Lock()
+        self._refresh = None
+
+    def _start(self, func, *args):
+        with self._lock:
+            try:
+                self.wait()
+            except Exception as e:
+                logging.warning("last refresh failed, carrying on with the next frame: %s", e)
+            self.epd.nowait(func, *args)
+            self._refresh = self._executor.submit(self.epd.wait)
+            return self._refresh
+
+    def display(self, *buffers):
+        """Uploads a frame and starts its refresh, returns a Future of the busy time"""
+        return self._start(self.epd.display, *buffers)
+
+    def clear(self, *args):
+        """Starts a full clear, returns a Future of the busy time"""
+        return self._start(self.epd.Clear, *args)
+
+    def wait(self, timeout=None):
+        """Blocks until the refresh in flight has finished, returns its busy time in ms"""
+        refresh = self._refresh
+        if refresh is None:
+            return 0.0
+        return refresh.result(timeout)
+
+    def init(self, *args):
+        """Wakes the panel once the refresh in flight has finished"""
+        with self._lock:
+            self.wait()
+            return self.epd.init(*args)
+
+    def sleep(self):
+        """Puts the panel to sleep once the refresh in flight has finished"""
+        with self._lock:
+            self.wait()
+            self.epd.sleep()
+
+    def close(self):
+        """Puts the panel to sleep and stops the background thread"""
+        self.sleep()
+        self._executor.shutdown()
+
+### END OF FILE ###
@@ -0,0 +1,106 @@
+# /*****************************************************************************
+# * | File        :	  epdbase.py
+# * | Function    :   What every e-Paper driver shares
+# * | Info        :
+# *----------------
+# * | Info        :   Talking to the controller and waiting on BUSY, written once
+# * |                 rather than per driver, so a refresh can be left running.
+# ******************************************************************************
+
+import logging
+
+
+class EPDBase:
+    """
+    The base of every driver's EPD. The driver sets `backend` and its pins in its __init__.
+
+    Drivers only talk to the controller through the send_* methods, and only wait on BUSY
+    through busy_wait(). That is what lets nowait() run a method such as display() without
+    waiting for the refresh it ends with: every wait inside it is put off until just before the
+    next byte goes out, so only the last one is still owed when it returns, which wait() makes.
+    For most panels that is the refresh, for those that power down after it the power off.
+    """
+
+    # Set while nowait() runs, and the wait on BUSY put off until the controller is next used
+    _nowait = False
+    _owed = None
+
+    def _settle(self):
+        if self._owed is not None:
+            self.wait()
+
+    def send_command(self, command):
+        self._settle()
+        self.backend.digital_write(self.dc_pin, 0)
+        self.backend.digital_write(self.cs_pin, 0)
+        self.backend.spi_writebyte([command])
+        self.backend.digital_write(self.cs_pin, 1)
+
+    def send_data(self, data):
+        self._settle()
+        self.backend.digital_write(self.dc_pin, 1)
+        self.backend.digital_write(self.cs_pin, 0)
+        self.backend.spi_writebyte([data])
+        self.backend.digital_write(self.cs_pin, 1)
+
+    def send_data2(self, data):
+        # A whole buffer of data in one transfer, rather than a byte at a time through send_data
+        self._settle()
+        self.backend.digital_write(self.dc_pin, 1)
+        self.backend.digital_write(self.cs_pin, 0)
+        self.backend.spi_writebyte2(data)
+        self.backend.digital_write(self.cs_pin, 1)
+
+    def send_sequence(self, sequence):
+        # One command byte, then its data in a single bulk transfer, for each (command, data) entry
+        for command, data in sequence:
+            self.send_command(command)
+            if data:
+                self.send_data2(data)
+
+    def _busy(self, idle, poll, settle_ms):
+        logging.debug("e-Paper busy")
+        self.busy_ms = self.backend.wait_until_idle(self.busy_pin, idle, poll=poll)
+        if settle_ms:
+            self.backend.delay_ms(settle_ms)
+        logging.debug("e-Paper busy release after %d ms", self.busy_ms)
+
+    def busy_wait(self, idle, poll=None, settle_ms=0):
+        """
+        Waits until BUSY reads `idle`, calling `poll` while it does if given (see the backend's
+        wait_until_idle), then `settle_ms` more. The time spent on BUSY is kept in `busy_ms`.
+        """
+        self._settle()
+        if self._nowait:
+            self._owed = (idle, poll, settle_ms)
+            return
+        self._busy(idle, poll, settle_ms)
+
+    def nowait(self, func, *args):
+        """
+        Runs `func`, one of this panel's methods such as display or Clear, without the wait on
+        BUSY it ends with, and returns what it returns. The refresh is left running until wait()
+        is called. The send_* methods call it themselves, reset() and init() must not be used
+        before it.
+        """
+        self._settle()
+        self._nowait = True
+        try:
+            return func(*args)
+        finally:
+            self._nowait = False
+
+    def display_nowait(self, *buffers):
+        """Uploads a frame and starts its refresh, without waiting for it (see nowait)"""
+        return self.nowait(self.display, *buffers)
+
+    def wait(self):
+        """Makes the wait on BUSY left off by nowait(), returns the time spent on BUSY in ms, 0 if none was owed"""
+        if self._owed is None:
+            return 0.0
+        idle, poll, settle_ms = self._owed
+        self._owed = None
+        self._busy(idle, poll, settle_ms)
+        return self.busy_ms
+
+### END OF FILE ###
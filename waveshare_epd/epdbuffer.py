@@ -0,0 +1,246 @@
+# /*****************************************************************************
+# * | File        :	  epdbuffer.py
+# * | Function    :   Framebuffer packing shared by the e-Paper drivers
+# * | Info        :
+# *----------------
+# * | Info        :   Builds each panel's RAM image in a single PIL pass instead
+# * |                 of setting bits pixel by pixel in Python.
+# ******************************************************************************
+
+import logging
+
+from PIL import Image, ImageChops
+
+
+def linewidth(width):
+    """Number of bytes in one framebuffer row of a 1-bit panel `width` pixels wide"""
+    return (width + 7) // 8
+
+
+def blank(width, height, fill=0xFF):
+    """A framebuffer with every byte set to `fill` (white, for 1-bit panels)"""
+    return bytearray([fill]) * (linewidth(width) * height)
+
+
+def orient(image, width, height, mode="1"):
+    """
+    Converts `image` to `mode` and lays it out the way the panel RAM expects it.
+    An image matching the panel is used as is, an image of the panel turned on its
+    side is rotated back. Anything else returns None.
+    """
+    image = image.convert(mode)
+    imwidth, imheight = image.size
+    if imwidth == width and imheight == height:
+        logging.debug("Horizontal")
+        return image
+    if imwidth == height and imheight == width:
+        logging.debug("Vertical")
+        return image.transpose(Image.ROTATE_90)
+    return None
+
+
+def pack(image, width, height):
+    """
+    Packs a mode "1" image that is already laid out like the panel into a 1-bit framebuffer.
+    Pixels are MSB first, black is 0, and rows are padded to whole bytes with white.
+    """
+    if image.size != (linewidth(width) * 8, height):
+        canvas = Image.new("1", (linewidth(width) * 8, height), 1)
+        canvas.paste(image, (0, 0))
+        image = canvas
+    return bytearray(image.tobytes())
+
+
+def getbuffer(image, width, height):
+    """The 1-bit framebuffer for `image`, or a white one if it does not fit the panel"""
+    panel = orient(image, width, height)
+    if panel is None:
+        return blank(width, height)
+    return pack(panel, width, height)
+
+
+_INVERT = bytes(0xFF - b for b in range(256))
+
+
+def invert(buf):
+    """`buf` with every bit flipped, the bulk equivalent of sending `~buf[i]` per byte"""
+    return bytes(buf).translate(_INVERT)
+
+
+def _expand_nibble(nibble):
+    value = 0
+    for bit in range(4):
+        if nibble & (0x08 >> bit):
+            value |= 0xC0 >> (bit * 2)
+    return value
+
+
+# Every 1-bit byte becomes two 2-bit bytes, one for each nibble
+_EXPAND_HIGH = bytes(_expand_nibble(b >> 4) for b in range(256))
+_EXPAND_LOW = bytes(_expand_nibble(b & 0x0F) for b in range(256))
+
+
+def expand_2bpp(buf):
+    """Widens a 1-bit framebuffer to 2 bits per pixel, 0 becoming 00 and 1 becoming 11"""
+    buf = bytes(buf)
+    wide = bytearray(len(buf) * 2)
+    wide[0::2] = buf.translate(_EXPAND_HIGH)
+    wide[1::2] = buf.translate(_EXPAND_LOW)
+    return wide
+
+
+def getbuffer_2bpp(image, width, height):
+    """
+    The framebuffer for panels that take 2 bits per pixel, with black as 00 and white as 11.
+    A monochrome image never produces the "red" 01 level. Returns an all black buffer if the
+    image does not fit the panel.
+    """
+    panel = orient(image, width, height)
+    if panel is None:
+        return bytearray(width * height // 4)
+    return expand_2bpp(pack(panel, width, height))
+
+
+def to_4bpp(buf, codes):
+    """
+    Re-packs a 2-bit framebuffer at 4 bits per pixel, for controllers that take a nibble per pixel.
+    Each 2-bit value v is replaced with codes[v].
+    """
+    high = bytes(codes[b >> 6] << 4 | codes[(b >> 4) & 0x03] for b in range(256))
+    low = bytes(codes[(b >> 2) & 0x03] << 4 | codes[b & 0x03] for b in range(256))
+    buf = bytes(buf)
+    wide = bytearray(len(buf) * 2)
+    wide[0::2] = buf.translate(high)
+    wide[1::2] = buf.translate(low)
+    return wide
+
+
+def unpack(buf, width, height):
+    """The mode "1" image held in a 1-bit framebuffer"""
+    image = Image.frombytes("1", (linewidth(width) * 8, height), bytes(buf))
+    if image.width != width:
+        image = image.crop((0, 0, width, height))
+    return image
+
+
+def pack_4bpp(image):
+    """Packs an "L" image of 4-bit values two pixels per byte, the left pixel in the high nibble"""
+    return bytearray(Image.frombytes("P", image.size, image.tobytes()).tobytes("raw", "P;4"))
+
+
+def _gray_code(value):
+    # The drivers' original mapping, exact 0xC0 and 0x80 are the light and dark grey levels
+    if value == 0xC0:
+        return 2
+    if value == 0x80:
+        return 1
+    return value >> 6
+
+
+_GRAY_CODES = [_gray_code(value) for value in range(256)]
+
+# The 4-grey levels black, dark grey, light grey and white, repeated to fill a PIL palette
+_GRAY_LEVELS = (0x00, 0x80, 0xC0, 0xFF)
+_GRAY_PALETTE = Image.new("P", (1, 1))
+_GRAY_PALETTE.putpalette([level for i in range(256) for level in (_GRAY_LEVELS[i % 4],) * 3])
+_GRAY_INDEX = bytes(i % 4 for i in range(256))
+
+
+def getbuffer_4gray(image, width, height, dither=False):
+    """
+    The 2 bits per pixel framebuffer of the 4-grey panels, 00 black to 11 white, MSB first.
+    An image of the panel turned on its side is transposed, as the drivers always did. With
+    `dither` the image is Floyd-Steinberg dithered onto the four levels instead of thresholded.
+    Returns a white buffer if the image does not fit the panel.
+    """
+    image = image.convert("L")
+    if image.size == (height, width) and width != height:
+        logging.debug("Horizontal")
+        image = image.transpose(Image.TRANSPOSE)
+    elif image.size == (width, height):
+        logging.debug("Vertical")
+    else:
+        return bytearray([0xFF]) * (width // 4 * height)
+    if dither:
+        codes = image.convert("RGB").quantize(palette=_GRAY_PALETTE, dither=Image.FLOYDSTEINBERG).tobytes().translate(_GRAY_INDEX)
+    else:
+        codes = image.point(_GRAY_CODES).tobytes()
+    return bytearray(Image.frombytes("P", image.size, codes).tobytes("raw", "P;2"))
+
+
+def _plane_nibble(byte, bit):
+    value = 0
+    for pixel in range(4):
+        value = value << 1 | (byte >> (6 - pixel * 2) >> bit) & 1
+    return value
+
+
+# One bit of every 2-bit pixel, as the high or the low nibble of a 1-bit byte
+_PLANE_TABLES = [
+    (bytes(_plane_nibble(b, bit) << 4 for b in range(256)), bytes(_plane_nibble(b, bit) for b in range(256)))
+    for bit in (0, 1)
+]
+
+
+def plane(buf, bit):
+    """
+    One bit plane of a 2-bit framebuffer as a 1-bit framebuffer, `bit` 1 for the high bit of
+    every pixel and 0 for the low one. Four grey controllers take the two planes in two RAMs.
+    """
+    buf = bytes(buf)
+    high, low = _PLANE_TABLES[bit]
+    # The nibbles never overlap, so ORing the two halves as big integers merges them
+    value = int.from_bytes(buf[0::2].translate(high), "big") | int.from_bytes(buf[1::2].translate(low), "big")
+    return bytearray(value.to_bytes(len(buf) // 2, "big"))
+
+
+# Pixels whose brightest and darkest channels are at least this far apart count as coloured
+_CHROMA = [0 if value < 128 else 255 for value in range(256)]
+# The same threshold straight to the colour plane, ink (0) where the pixel is coloured
+_CHROMA_INK = [255 if value < 128 else 0 for value in range(256)]
+
+
+def _spread(image):
+    # The grey image, and how far apart the brightest and darkest channel of each pixel are
+    image = image.convert("RGB")
+    r, g, b = image.split()
+    high = ImageChops.lighter(ImageChops.lighter(r, g), b)
+    low = ImageChops.darker(ImageChops.darker(r, g), b)
+    return image.convert("L"), ImageChops.subtract(high, low)
+
+
+def split_colour(image):
+    """
+    Splits a single RGB or palette image into the black and the colour image of a tri-colour panel.
+    Saturated pixels (red, or yellow on the yellow panels) go to the colour image and are left out
+    of the black one, grey levels stay in the black image to be dithered as before.
+    """
+    grey, spread = _spread(image)
+    colour = spread.point(_CHROMA)
+    return ImageChops.lighter(grey, colour), ImageChops.invert(colour)
+
+
+class ColourPanel:
+    """
+    Mixed into the drivers of tri-colour panels, whose display() takes a black and a colour
+    framebuffer, so both can be had from one colour image.
+    """
+
+    def getbuffers(self, image):
+        """
+        The black and the colour framebuffer of `image`, split as split_colour does and packed as
+        getbuffer would. The colour plane is thresholded straight to 1 bit, only the black one
+        is dithered.
+        """
+        width, height = self.width, self.height
+        if image.size not in ((width, height), (height, width)):
+            # Whatever the driver's getbuffer makes of an image that does not fit, for both planes
+            buf = self.getbuffer(image)
+            return buf, bytearray(buf)
+        grey, spread = _spread(image)
+        black = orient(ImageChops.lighter(grey, spread.point(_CHROMA)), width, height)
+        colour = orient(spread.point(_CHROMA_INK, "1"), width, height)
+        return pack(black, width, height), pack(colour, width, height)
+
+
+### END OF FILE ###
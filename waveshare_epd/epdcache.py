@@ -0,0 +1,96 @@
+# /*****************************************************************************
+# * | File        :	  epdcache.py
+# * | Function    :   Remembers the last frame put on the panel between runs
+# * | Info        :
+# *----------------
+# * | Info        :   A digest of the framebuffers is kept on disk so a frame that
+# * |                 is already on the panel is not uploaded and refreshed again.
+# ******************************************************************************
+
+import hashlib
+import logging
+import mmap
+import os
+
+
+def digest(*buffers):
+    """A digest of the framebuffers of one frame, in the order they are sent"""
+    h = hashlib.sha1()
+    for buf in buffers:
+        h.update(len(buf).to_bytes(4, "big"))
+        h.update(bytes(buf))
+    return h.hexdigest()
+
+
+def _write(path, data):
+    # Written next to the target and renamed over it, so a run killed mid write leaves the old file
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class FrameCache:
+    """
+    The frame last shown on a panel, persisted at `path` (by default `<driver>.frame` in the
+    working directory, so every script driving the same panel shares it).
+    With `keep_buffers` the framebuffers themselves are saved too, in `path` + ".buf", and can be
+    read back memory-mapped with buffers().
+    """
+
+    def __init__(self, epd, path=None, keep_buffers=False):
+        if path is None:
+            path = type(epd).__module__.rsplit(".", 1)[-1] + ".frame"
+        self.path = path
+        self.keep_buffers = keep_buffers
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                fields = f.read().split()
+        except OSError:
+            return None, []
+        if not fields:
+            return None, []
+        return fields[0], [int(n) for n in fields[1:]]
+
+    def unchanged(self, *buffers):
+        """True if `buffers` is the frame already on the panel"""
+        last, _ = self._read()
+        if last is not None and last == digest(*buffers):
+            logging.info("frame cache hit, the panel already shows this frame")
+            return True
+        return False
+
+    def store(self, *buffers):
+        """Records `buffers` as the frame on the panel, call it once the refresh has finished"""
+        if self.keep_buffers:
+            _write(self.path + ".buf", b"".join(bytes(buf) for buf in buffers))
+        _write(self.path, " ".join([digest(*buffers)] + [str(len(buf)) for buf in buffers]).encode() + b"\n")
+
+    def forget(self):
+        """Drops the record, so the next frame is shown whatever it is"""
+        for path in (self.path, self.path + ".buf"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def buffers(self):
+        """The framebuffers of the frame on the panel as memoryviews, or None if they were not kept"""
+        last, lengths = self._read()
+        try:
+            with open(self.path + ".buf", "rb") as f:
+                if os.fstat(f.fileno()).st_size != sum(lengths) or not lengths:
+                    return None
+                data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except OSError:
+            return None
+        views = []
+        offset = 0
+        for length in lengths:
+            views.append(data[offset:offset + length])
+            offset += length
+        if digest(*views) != last:
+            return None
+        return views
+
+### END OF FILE ###
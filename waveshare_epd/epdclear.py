@@ -0,0 +1,89 @@
+# /*****************************************************************************
+# * | File        :	  epdclear.py
+# * | Function    :   Decides when a panel needs a full clear cycle
+# * | Info        :
+# *----------------
+# * | Info        :   Keeps the refresh history of a panel on disk and spends a
+# * |                 ghosting budget, instead of clearing at random.
+# ******************************************************************************
+
+import json
+import logging
+import time
+
+from .epdcache import _write
+
+# Frames shown since the last clear before the next one
+MAX_UPDATES = 10
+# Changed pixels since the last clear, in whole panels, before the next one
+MAX_CHANGED = 2.0
+# Longest time between two clears, in seconds
+MAX_AGE = 24 * 60 * 60
+
+
+def changed_fraction(old, new):
+    """The share of bits that differ between two sets of framebuffers, 1.0 if there is nothing to compare"""
+    if old is None or len(old) != len(new):
+        return 1.0
+    changed = 0
+    total = 0
+    for a, b in zip(old, new):
+        if len(a) != len(b):
+            return 1.0
+        changed += bin(int.from_bytes(bytes(a), "big") ^ int.from_bytes(bytes(b), "big")).count("1")
+        total += len(b) * 8
+    return changed / float(total) if total else 0.0
+
+
+class ClearScheduler:
+    """
+    Tracks the updates shown on a panel since its last full clear, in `<driver>.history` in the
+    working directory unless `path` says otherwise. due() asks for a clear once any part of the
+    budget is spent: `max_updates` frames, `max_changed` panels worth of changed pixels or
+    `max_age` seconds.
+    """
+
+    def __init__(self, epd, path=None, max_updates=MAX_UPDATES, max_changed=MAX_CHANGED, max_age=MAX_AGE):
+        if path is None:
+            path = type(epd).__module__.rsplit(".", 1)[-1] + ".history"
+        self.path = path
+        self.max_updates = max_updates
+        self.max_changed = max_changed
+        self.max_age = max_age
+        self.history = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # No history yet, the panel state is unknown so the first frame clears it
+            return {"updates": 0, "changed": 0.0, "last_clear": 0}
+
+    def due(self):
+        """True if the next frame should be preceded by a full clear"""
+        history = self.history
+        reasons = []
+        if history["updates"] >= self.max_updates:
+            reasons.append("%d updates" % history["updates"])
+        if history["changed"] >= self.max_changed:
+            reasons.append("%.1f panels changed" % history["changed"])
+        if time.time() - history["last_clear"] >= self.max_age:
+            reasons.append("%.0f h since the last clear" % ((time.time() - history["last_clear"]) / 3600))
+        if reasons:
+            logging.info("clear due: %s", ", ".join(reasons))
+        return bool(reasons)
+
+    def record(self, buffers, previous=None, cleared=False):
+        """
+        Adds a shown frame to the history, `previous` being the frame it replaced if known.
+        A cleared frame starts the budget again.
+        """
+        if cleared:
+            self.history = {"updates": 0, "changed": 0.0, "last_clear": time.time()}
+        else:
+            self.history["updates"] += 1
+            self.history["changed"] += changed_fraction(previous, buffers)
+        _write(self.path, json.dumps(self.history).encode())
+
+### END OF FILE ###
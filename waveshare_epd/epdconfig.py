@@ -32,22 +32,63 @@ import logging
 import sys
 import time
 
+# Pin definition, BCM numbering, the defaults of every backend
+RST_PIN         = 17
+DC_PIN          = 25
+CS_PIN          = 8
+BUSY_PIN        = 24
+
+# Longest a refresh may hold BUSY before we stop waiting on it
+BUSY_TIMEOUT_MS = 60000
+# Longest single wait for an edge, bounding the cost of an edge that fires before we start waiting
+EDGE_SLICE_MS = 200
+# Range of the sleep between reads when BUSY is polled, it doubles each time the panel is still busy
+POLL_MIN_MS = 1
+POLL_MAX_MS = 100
+
+
+def _wait_until_idle(GPIO, pin, idle, timeout_ms, edge, poll):
+    """
+    Blocks until `pin` reads `idle` and returns how long that took in ms.
+    With `edge` the wait sleeps in GPIO.wait_for_edge, otherwise, or when edge detection is not
+    available, BUSY is polled with a growing sleep. `poll` is called before every read, for
+    controllers that need a status command to refresh the line, and always selects polling.
+    """
+    start = time.monotonic()
+    deadline = start + timeout_ms / 1000.0
+    sleep_ms = POLL_MIN_MS
+    while True:
+        if poll is not None:
+            poll()
+        if GPIO.input(pin) == idle:
+            break
+        remaining_ms = (deadline - time.monotonic()) * 1000.0
+        if remaining_ms <= 0:
+            logging.warning("e-Paper still busy after %d ms, carrying on", timeout_ms)
+            break
+        if edge and poll is None:
+            try:
+                GPIO.wait_for_edge(pin, GPIO.RISING if idle else GPIO.FALLING, timeout=int(min(EDGE_SLICE_MS, remaining_ms)) + 1)
+                continue
+            except RuntimeError as e:
+                logging.debug("edge detection unavailable, polling BUSY instead: %s", e)
+                edge = False
+        time.sleep(min(sleep_ms, remaining_ms) / 1000.0)
+        sleep_ms = min(sleep_ms * 2, POLL_MAX_MS)
+    return (time.monotonic() - start) * 1000.0
 
-class RaspberryPi:
-    # Pin definition
-    RST_PIN         = 17
-    DC_PIN          = 25
-    CS_PIN          = 8
-    BUSY_PIN        = 24
 
-    def __init__(self):
+class RaspberryPi:
+    def __init__(self, rst=RST_PIN, dc=DC_PIN, cs=CS_PIN, busy=BUSY_PIN, bus=0, device=0):
         import spidev
         import RPi.GPIO
 
+        self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN = rst, dc, cs, busy
         self.GPIO = RPi.GPIO
+        self.held = False
 
-        # SPI device, bus = 0, device = 0
-        self.SPI = spidev.SpiDev(0, 0)
+        # SPI device, bus = 0, device = 0 unless a second panel sits on another chip select
+        self.SPI = spidev.SpiDev(bus, device)
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -55,12 +96,19 @@ class RaspberryPi:
     def digital_read(self, pin):
         return self.GPIO.input(pin)
 
+    def wait_until_idle(self, pin, idle, timeout_ms=BUSY_TIMEOUT_MS, edge=True, poll=None):
+        return _wait_until_idle(self.GPIO, pin, idle, timeout_ms, edge, poll)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
         self.SPI.writebytes(data)
 
+    def spi_writebyte2(self, data):
+        # Streams a whole buffer, spidev splits it into bufsiz sized transfers
+        self.SPI.writebytes2(data)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -72,7 +120,18 @@ class RaspberryPi:
         self.SPI.mode = 0b00
         return 0
 
+    def hold(self, held=True):
+        # A resident process keeps SPI and the GPIOs open across frames, module_exit leaves them be
+        self.held = held
+
+    def set_controller(self, family):
+        # Only the virtual panel needs to know what the commands mean
+        pass
+
     def module_exit(self):
+        if self.held:
+            logging.debug("module held open")
+            return
         logging.debug("spi end")
         self.SPI.close()
 
@@ -80,17 +139,12 @@ class RaspberryPi:
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
 
-        self.GPIO.cleanup()
+        # Only this panel's pins, another panel in the same process may still be using its own
+        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN])
 
 
 class JetsonNano:
-    # Pin definition
-    RST_PIN         = 17
-    DC_PIN          = 25
-    CS_PIN          = 8
-    BUSY_PIN        = 24
-
-    def __init__(self):
+    def __init__(self, rst=RST_PIN, dc=DC_PIN, cs=CS_PIN, busy=BUSY_PIN):
         import ctypes
         find_dirs = [
             os.path.dirname(os.path.realpath(__file__)),
@@ -101,13 +155,31 @@ class JetsonNano:
         for find_dir in find_dirs:
             so_filename = os.path.join(find_dir, 'sysfs_software_spi.so')
             if os.path.exists(so_filename):
-                self.SPI = ctypes.cdll.LoadLibrary(so_filename)
+                # Global, so the buffer helper below finds the transfer function in it
+                self.SPI = ctypes.CDLL(so_filename, mode=ctypes.RTLD_GLOBAL)
                 break
         if self.SPI is None:
             raise RuntimeError('Cannot find sysfs_software_spi.so')
 
+        # The library only moves a byte per call. sysfs_software_spi_buffer.so, built from the .c
+        # file next to this one (see the build line in it), loops over a whole buffer in C. Without
+        # it each byte of a frame is a call through ctypes.
+        self._transfer = self.SPI.SYSFS_software_spi_transfer
+        self._transfer_buffer = None
+        for find_dir in find_dirs:
+            so_filename = os.path.join(find_dir, 'sysfs_software_spi_buffer.so')
+            if os.path.exists(so_filename):
+                self._transfer_buffer = ctypes.CDLL(so_filename).SYSFS_software_spi_transfer_buffer
+                self._transfer_buffer.argtypes = [ctypes.c_char_p, ctypes.c_uint32]
+                self._transfer_buffer.restype = None
+                break
+        if self._transfer_buffer is None:
+            logging.info("sysfs_software_spi_buffer.so not built, sending frames a byte per call")
+
         import Jetson.GPIO
+        self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN = rst, dc, cs, busy
         self.GPIO = Jetson.GPIO
+        self.held = False
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -115,12 +187,24 @@ class JetsonNano:
     def digital_read(self, pin):
         return self.GPIO.input(self.BUSY_PIN)
 
+    def wait_until_idle(self, pin, idle, timeout_ms=BUSY_TIMEOUT_MS, edge=True, poll=None):
+        return _wait_until_idle(self.GPIO, self.BUSY_PIN, idle, timeout_ms, edge, poll)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
         self.SPI.SYSFS_software_spi_transfer(data[0])
 
+    def spi_writebyte2(self, data):
+        if self._transfer_buffer is not None:
+            data = bytes(value & 0xFF for value in data) if isinstance(data, (list, tuple)) else bytes(data)
+            self._transfer_buffer(data, len(data))
+            return
+        transfer = self._transfer
+        for value in data:
+            transfer(value)
+
     def module_init(self):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
@@ -131,7 +215,18 @@ class JetsonNano:
         self.SPI.SYSFS_software_spi_begin()
         return 0
 
+    def hold(self, held=True):
+        # A resident process keeps SPI and the GPIOs open across frames, module_exit leaves them be
+        self.held = held
+
+    def set_controller(self, family):
+        # Only the virtual panel needs to know what the commands mean
+        pass
+
     def module_exit(self):
+        if self.held:
+            logging.debug("module held open")
+            return
         logging.debug("spi end")
         self.SPI.SYSFS_software_spi_end()
 
@@ -139,16 +234,230 @@ class JetsonNano:
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
 
-        self.GPIO.cleanup()
+        # Only this panel's pins, another panel in the same process may still be using its own
+        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN])
+
+
+class Virtual:
+    """
+    A stand-in panel for machines without one, selected with EPD_BACKEND=virtual.
+    Every transfer is recorded with its timestamp, BUSY is held for EPD_VIRTUAL_REFRESH_MS after
+    each refresh, and the RAM writes can be turned back into an image with save_png.
+    Delays and busy time are only slept through with EPD_VIRTUAL_REALTIME=1, otherwise they are
+    just added up so benchmarks run at full speed. The counters are reset by reset_stats, so read
+    them through the backend object (epdconfig.implementation for the default one) rather than the
+    copies exported onto the module.
+    """
+    # The commands that write a frame into display RAM, and the ones that refresh the panel, per
+    # controller family. The two overlap: 0x20-0x24 are LUT registers on the UC81xx, 0x10 is deep
+    # sleep and 0x12 the software reset on the SSD16xx.
+    CONTROLLERS = {
+        'ssd16xx': ((0x24, 0x26), (0x20,)),
+        'uc81xx': ((0x10, 0x13), (0x12,)),
+    }
+    # Until a driver says which it has, both are taken. A refresh only counts once a frame has been
+    # written, which keeps the SSD16xx software reset out of it.
+    RAM_COMMANDS = (0x10, 0x13, 0x24, 0x26)
+    REFRESH_COMMANDS = (0x12, 0x20)
+
+    def __init__(self, rst=RST_PIN, dc=DC_PIN, cs=CS_PIN, busy=BUSY_PIN):
+        self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN = rst, dc, cs, busy
+        self.refresh_ms = float(os.environ.get('EPD_VIRTUAL_REFRESH_MS', 0))
+        self.realtime = os.environ.get('EPD_VIRTUAL_REALTIME') == '1'
+        self.png = os.environ.get('EPD_VIRTUAL_PNG')
+        self.size = os.environ.get('EPD_VIRTUAL_SIZE')
+        self.pins = {}
+        self.held = False
+        self.ram_commands = self.RAM_COMMANDS
+        self.refresh_commands = self.REFRESH_COMMANDS
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Forgets everything recorded so far, the panel RAM included"""
+        # (timestamp, dc, bytes) for every SPI transfer
+        self.transfers = []
+        self.ram = {}
+        self.pending = bytearray()
+        # RAM commands whose frame has been refreshed onto the panel
+        self.shown = set()
+        self.command = None
+        self.written = False
+        self.busy_until = 0.0
+        self.gpio_writes = 0
+        self.bytes_sent = 0
+        self.delayed_ms = 0.0
+        self.busy_total_ms = 0.0
+        self.refreshes = 0
+
+    def _now_ms(self):
+        return time.monotonic() * 1000.0 + (0.0 if self.realtime else self.delayed_ms + self.busy_total_ms)
+
+    def digital_write(self, pin, value):
+        self.gpio_writes += 1
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        busy = self._now_ms() < self.busy_until
+        return int(busy) if pin == self.BUSY_PIN else self.pins.get(pin, 0)
+
+    def wait_until_idle(self, pin, idle, timeout_ms=BUSY_TIMEOUT_MS, edge=True, poll=None):
+        if poll is not None:
+            poll()
+        busy_ms = min(max(self.busy_until - self._now_ms(), 0.0), timeout_ms)
+        if self.realtime:
+            time.sleep(busy_ms / 1000.0)
+        self.busy_total_ms += busy_ms
+        return busy_ms
+
+    def delay_ms(self, delaytime):
+        if self.realtime:
+            time.sleep(delaytime / 1000.0)
+        self.delayed_ms += delaytime
+
+    def spi_writebyte(self, data):
+        self.spi_writebyte2(data)
+
+    def spi_writebyte2(self, data):
+        data = bytes(value & 0xFF for value in data) if isinstance(data, (list, tuple)) else bytes(data)
+        dc = self.pins.get(self.DC_PIN, 0)
+        self.transfers.append((time.monotonic(), dc, data))
+        self.bytes_sent += len(data)
+        if dc:
+            if self.command in self.ram_commands:
+                self.pending += data
+                self.written = True
+            return
+        for command in data:
+            self._flush()
+            self.command = command
+            if command in self.refresh_commands and self.written:
+                self.busy_until = self._now_ms() + self.refresh_ms
+                self.written = False
+                self.shown = set(self.ram)
+                self.refreshes += 1
+
+    def _flush(self):
+        # Writes between two refreshes add up to one frame, drivers that move the RAM cursor send
+        # it a row at a time. A single byte after 0x10 is the SSD16xx deep sleep mode, not a frame.
+        if self.command in self.ram_commands and len(self.pending) > 1:
+            if self.command in self.shown or self.command not in self.ram:
+                self.ram[self.command] = bytearray()
+                self.shown.discard(self.command)
+            self.ram[self.command] += self.pending
+        self.pending = bytearray()
+
+    def planes(self, width, height):
+        """The last frame written to each RAM command, as "L" images in command order"""
+        from PIL import Image
+
+        self._flush()
+        images = []
+        for command in sorted(self.ram):
+            data = bytes(self.ram[command])
+            # 1, 2 or 4 bits per pixel, whichever the amount of data fits
+            for rawmode, bits in (('1', 1), ('P;2', 2), ('P;4', 4)):
+                if len(data) == ((width * bits + 7) // 8) * height:
+                    break
+            else:
+                logging.warning("RAM 0x%02X holds %d bytes, not a %dx%d frame", command, len(data), width, height)
+                continue
+            if bits == 1:
+                image = Image.frombytes('1', (width, height), data).convert('L')
+            else:
+                image = Image.frombytes('P', (width, height), data, 'raw', rawmode)
+                image = Image.frombytes('L', (width, height), image.tobytes()).point(lambda value: value * 255 // ((1 << bits) - 1))
+            images.append(image)
+        return images
+
+    def save_png(self, path, width, height):
+        """Saves the RAM planes side by side, in command order, as one PNG"""
+        from PIL import Image
+
+        images = self.planes(width, height)
+        frame = Image.new('L', (max(1, width * len(images)), height), 255)
+        for i, image in enumerate(images):
+            frame.paste(image, (i * width, 0))
+        frame.save(path)
+        return frame
+
+    def module_init(self):
+        return 0
+
+    def hold(self, held=True):
+        # A resident process keeps SPI and the GPIOs open across frames, module_exit leaves them be
+        self.held = held
+
+    def set_controller(self, family):
+        """Reads the commands as the `family` of controller (see CONTROLLERS) does"""
+        self.ram_commands, self.refresh_commands = self.CONTROLLERS[family]
+
+    def module_exit(self):
+        if self.held:
+            logging.debug("module held open")
+            return
+        logging.debug("virtual panel: %d bytes, %d GPIO writes, %d refreshes, %.0f ms delays, %.0f ms busy",
+            self.bytes_sent, self.gpio_writes, self.refreshes, self.delayed_ms, self.busy_total_ms)
+        if self.png and self.size:
+            width, height = (int(n) for n in self.size.lower().split('x'))
+            self.save_png(self.png, width, height)
+
+
+BACKENDS = {
+    'raspberrypi': RaspberryPi,
+    'jetson': JetsonNano,
+    'virtual': Virtual,
+}
+
+
+def create(name=None, **pins):
+    """
+    A new backend, `name` being one of BACKENDS. Without one it is picked from EPD_BACKEND, or
+    from the platform when that is not set. `pins` are passed on, e.g. rst=27, cs=7, device=1.
+    """
+    if name is None:
+        name = os.environ.get('EPD_BACKEND', '').lower()
+    if not name:
+        name = 'raspberrypi' if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835') else 'jetson'
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError("unknown backend %r, expected one of %s" % (name, ", ".join(sorted(BACKENDS))))
+    return backend(**pins)
+
+
+# Controller family of the panel on the default backend, kept until the backend is created
+_controller = None
+
+
+def set_controller(family):
+    """Tells the default backend which controller family (see Virtual.CONTROLLERS) the panel has"""
+    global _controller
+    _controller = family
+    if 'implementation' in globals():
+        implementation.set_controller(family)
+
 
+def default():
+    """
+    The backend drivers fall back on when they are not handed one, created on first use and
+    exported onto this module like the original single backend was.
+    """
+    module = sys.modules[__name__]
+    if 'implementation' not in vars(module):
+        module.implementation = create()
+        if _controller is not None:
+            module.implementation.set_controller(_controller)
+        for func in [x for x in dir(module.implementation) if not x.startswith('_')]:
+            setattr(module, func, getattr(module.implementation, func))
+    return module.implementation
 
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
-    implementation = RaspberryPi()
-else:
-    implementation = JetsonNano()
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+def __getattr__(name):
+    # Anything not defined yet (implementation, digital_write, module_init...) comes from the
+    # default backend, so importing a driver touches no hardware until it is used
+    if name.startswith('_'):
+        raise AttributeError(name)
+    return getattr(default(), name)
 
 
 ### END OF FILE ###
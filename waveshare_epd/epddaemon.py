@@ -0,0 +1,160 @@
+# /*****************************************************************************
+# * | File        :	  epddaemon.py
+# * | Function    :   Resident process that owns a panel and takes frames over a socket
+# * | Info        :
+# *----------------
+# * | Info        :   Keeps SPI open and the controller initialised between frames,
+# * |                 so each update only pays for the upload and the refresh.
+# ******************************************************************************
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import time
+
+from . import epdcache
+from . import epdpartial
+from . import panel as new_panel
+
+SOCKET_PATH = "/tmp/epd.sock"
+
+# Drivers whose refresh sequence (0x22 0xC7) switches the analog circuits off once the frame
+# is shown, so the controller can be left awake between frames and needs no reset or init
+LIGHT_SLEEP = ("epd7in5b_V3", "epd7in5b_HD")
+
+
+class Panel:
+    """
+    Drives one panel for as long as the process lives. SPI and the GPIOs stay open, and on the
+    panels in LIGHT_SLEEP the controller is never put in deep sleep, so a frame goes straight to
+    display(). Other panels deep sleep between frames and are woken with init() as usual.
+    Panels with a partial mode (see epdpartial.DRIVERS) take their frames through PartialRefresh,
+    which keeps the last frame for as long as the process lives and only refreshes what changed.
+    The last timing of every phase, in ms, is kept in `timings`, and whether the last frame was
+    a "full" or a "partial" refresh in `refresh`.
+    """
+
+    def __init__(self, driver, backend=None):
+        self.epd = new_panel(driver, backend)
+        self.name = type(self.epd).__module__.rsplit(".", 1)[-1]
+        self.cache = epdcache.FrameCache(self.epd, keep_buffers=True)
+        self.light = self.name in LIGHT_SLEEP
+        self.awake = False
+        self.partial = epdpartial.PartialRefresh(self.epd) if self.name in epdpartial.DRIVERS else None
+        self.refresh = None
+        self.timings = {}
+        self.frames = 0
+        self.epd.backend.hold()
+
+    def _timed(self, phase, func, *args):
+        start = time.monotonic()
+        func(*args)
+        self.timings[phase] = (time.monotonic() - start) * 1000.0
+        return self.timings[phase]
+
+    def show(self, buffers, clear=False):
+        """Puts a frame on the panel unless it is already there, returns whether it was shown"""
+        if self.cache.unchanged(*buffers):
+            return False
+        self.timings = {}
+        try:
+            if self.partial is not None:
+                # The engine wakes the panel into the mode it needs, and a clear is a full refresh
+                self.epd.busy_ms = 0
+                start = time.monotonic()
+                self.refresh = self.partial.display(*buffers, full=clear)
+                total = self.timings["display"] = (time.monotonic() - start) * 1000.0
+                self.awake = True
+            else:
+                if self.awake:
+                    self.timings["init"] = 0.0
+                else:
+                    self._timed("init", self.epd.init)
+                    self.awake = True
+                if clear:
+                    self._timed("clear", self.epd.Clear)
+                total = self._timed("display", self.epd.display, *buffers)
+                self.refresh = "full"
+        except Exception:
+            # Whatever state the controller is in, the next frame starts it from scratch
+            self.awake = False
+            if self.partial is not None:
+                self.partial.mode = None
+            raise
+        # The refresh is the wait on BUSY that ends display(), the rest went on the upload (and,
+        # for panels woken by the partial refresh engine, on the init)
+        self.timings["refresh"] = self.epd.busy_ms
+        self.timings["upload"] = max(total - self.epd.busy_ms, 0.0)
+        self.timings.pop("display")
+        if not self.light:
+            self._timed("sleep", self.partial.sleep if self.partial is not None else self.epd.sleep)
+            self.awake = False
+        self.cache.store(*buffers)
+        self.frames += 1
+        logging.info("frame %d shown, %s refresh, %s", self.frames, self.refresh, ", ".join("%s %.0f ms" % item for item in sorted(self.timings.items())))
+        return True
+
+    def close(self):
+        """Deep sleeps the panel if it is awake and releases SPI and the GPIOs"""
+        self.epd.backend.hold(False)
+        if self.awake:
+            (self.partial.sleep if self.partial is not None else self.epd.sleep)()
+        else:
+            # Never initialised, or already in deep sleep: there is nothing to send it
+            self.epd.backend.module_exit()
+        self.awake = False
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # One JSON header line, {"lengths": [...], "clear": false}, followed by the framebuffers.
+    # The reply is a JSON line with whether the frame was shown, how, and the phase timings.
+    def handle(self):
+        panel = self.server.panel
+        try:
+            header = json.loads(self.rfile.readline().decode())
+            buffers = [self.rfile.read(length) for length in header.get("lengths", [])]
+            if any(len(buf) != length for buf, length in zip(buffers, header["lengths"])):
+                raise ValueError("frame cut short")
+            shown = panel.show(buffers, header.get("clear", False)) if buffers else False
+            reply = {"ok": True, "shown": shown, "refresh": panel.refresh if shown else None, "timings": panel.timings if shown else {}, "frames": panel.frames}
+        except Exception as e:
+            logging.exception(e)
+            reply = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(reply).encode() + b"\n")
+
+
+def serve(driver, path=SOCKET_PATH, backend=None):
+    """Runs the panel service on the unix socket at `path` until interrupted"""
+    if os.path.exists(path):
+        os.remove(path)
+    panel = Panel(driver, backend)
+    server = socketserver.UnixStreamServer(path, _Handler)
+    server.panel = panel
+    logging.info("serving %s on %s", driver, path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+        panel.close()
+
+
+def send(buffers, clear=False, path=SOCKET_PATH, timeout=120):
+    """
+    Hands a frame to a running panel service and returns its reply.
+    Raises FileNotFoundError or ConnectionRefusedError if no service is listening at `path`.
+    """
+    buffers = [bytes(buf) for buf in buffers]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"lengths": [len(buf) for buf in buffers], "clear": clear}).encode() + b"\n")
+        sock.sendall(b"".join(buffers))
+        reply = json.loads(sock.makefile("rb").readline().decode())
+    if not reply.get("ok"):
+        raise RuntimeError("panel service failed: %s" % reply.get("error"))
+    return reply
+
+### END OF FILE ###
@@ -0,0 +1,166 @@
+# /*****************************************************************************
+# * | File        :	  epdpartial.py
+# * | Function    :   Dirty rectangle partial refresh for the 1-bit drivers
+# * | Info        :
+# *----------------
+# * | Info        :   Keeps the last framebuffer sent to the panel and only
+# * |                 refreshes what changed, using the driver's partial LUT.
+# ******************************************************************************
+
+import collections
+import logging
+
+from . import epdbuffer
+
+# Share of the panel that may change before a partial refresh costs more than it saves
+MAX_AREA = 0.35
+# Partial refreshes in a row before a full one, to clear the ghosting they leave behind
+MAX_PARTIALS = 5
+# Changed row bands closer than this are refreshed as one window
+MERGE_ROWS = 8
+
+# How the engine drives one panel. `init(epd, partial)` wakes it into a mode, `full(epd, buf)`
+# shows a whole frame and `partial(epd, buf, rect)` refreshes one window of one, with the ends
+# exclusive. With `modal` the panel has to be re-initialised to move between full and partial
+# mode, and with `windowed` the partial refresh is limited to the window rather than the whole
+# panel.
+Driver = collections.namedtuple("Driver", "init full partial modal windowed")
+
+
+DRIVERS = {
+    "epd4in2": Driver(
+        init=lambda epd, partial: epd.init(),
+        full=lambda epd, buf: epd.display(buf),
+        partial=lambda epd, buf, rect: epd.EPD_4IN2_PartialDisplay(*rect, buf),
+        modal=False,
+        windowed=True,
+    ),
+    # The base image goes to both RAMs, the controller diffs the next partial frame against it
+    "epd2in13_V2": Driver(
+        init=lambda epd, partial: epd.init(epd.PART_UPDATE if partial else epd.FULL_UPDATE),
+        full=lambda epd, buf: epd.displayPartBaseImage(buf),
+        partial=lambda epd, buf, rect: epd.displayPartial(buf),
+        modal=True,
+        windowed=False,
+    ),
+    "epd2in9d": Driver(
+        init=lambda epd, partial: epd.init(),
+        full=lambda epd, buf: epd.display(buf),
+        partial=lambda epd, buf, rect: epd.DisplayPartial(buf),
+        modal=False,
+        windowed=False,
+    ),
+    "epd2in13d": Driver(
+        init=lambda epd, partial: epd.init(),
+        full=lambda epd, buf: epd.display(buf),
+        partial=lambda epd, buf, rect: epd.DisplayPartial(buf),
+        modal=False,
+        windowed=False,
+    ),
+}
+
+
+def dirty_rects(old, new, width, height, merge_rows=MERGE_ROWS):
+    """
+    The rectangles where two 1-bit framebuffers differ, as (x_start, y_start, x_end, y_end) with
+    the ends exclusive. x is in whole bytes, so every rectangle starts and ends on a multiple of 8.
+    Changed rows closer than `merge_rows` are joined into one rectangle.
+    """
+    line = epdbuffer.linewidth(width)
+    old = bytes(old)
+    new = bytes(new)
+    rects = []
+    band = None
+    for y in range(height):
+        start = y * line
+        if old[start:start + line] == new[start:start + line]:
+            continue
+        # The first and last differing byte of the row, from the set bits of the XOR
+        diff = int.from_bytes(old[start:start + line], "big") ^ int.from_bytes(new[start:start + line], "big")
+        first = line - 1 - (diff.bit_length() - 1) // 8
+        last = line - 1 - ((diff & -diff).bit_length() - 1) // 8
+        if band is not None and y - band[3] < merge_rows:
+            band = [min(band[0], first), band[1], max(band[2], last + 1), y + 1]
+        else:
+            if band is not None:
+                rects.append(band)
+            band = [first, y, last + 1, y + 1]
+    if band is not None:
+        rects.append(band)
+    return [(x_start * 8, y_start, x_end * 8, y_end) for x_start, y_start, x_end, y_end in rects]
+
+
+def bounding_box(rects):
+    """The smallest rectangle holding all of `rects`"""
+    return (min(r[0] for r in rects), min(r[1] for r in rects), max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+class PartialRefresh:
+    """
+    Puts 1-bit framebuffers on a panel, refreshing only what changed since the last one.
+    The first frame, frames that change more than `max_area` of the panel and every frame after
+    `max_partials` partial refreshes in a row go out as a full refresh, everything else through
+    the driver's partial mode, in one refresh of the window around everything that changed.
+    Frames identical to the last one are not sent at all.
+    """
+
+    def __init__(self, epd, max_area=MAX_AREA, max_partials=MAX_PARTIALS, merge_rows=MERGE_ROWS):
+        name = type(epd).__module__.rsplit(".", 1)[-1]
+        if name not in DRIVERS:
+            raise ValueError("%s has no partial refresh support" % name)
+        self.epd = epd
+        self.driver = DRIVERS[name]
+        self.max_area = max_area
+        self.max_partials = max_partials
+        self.merge_rows = merge_rows
+        self.last = None
+        self.mode = None
+        self.partials = 0
+
+    def _wake(self, partial):
+        mode = "partial" if partial and self.driver.modal else "full"
+        if self.mode != mode:
+            self.driver.init(self.epd, partial)
+            self.mode = mode
+
+    def full(self, buf):
+        """Shows `buf` with a full refresh, clearing any ghosting"""
+        self._wake(False)
+        self.driver.full(self.epd, buf)
+        self.last = bytes(buf)
+        self.partials = 0
+
+    def display(self, buf, full=False):
+        """
+        Shows `buf` and returns how: "none" when nothing changed, "partial" or "full". With `full`
+        it is a full refresh whatever changed.
+        """
+        if full or self.last is None or self.partials >= self.max_partials:
+            logging.debug("full refresh after %d partial refreshes", self.partials)
+            self.full(buf)
+            return "full"
+        rects = dirty_rects(self.last, buf, self.epd.width, self.epd.height, self.merge_rows)
+        if not rects:
+            logging.debug("frame unchanged, nothing to refresh")
+            return "none"
+        area = sum((x_end - x_start) * (y_end - y_start) for x_start, y_start, x_end, y_end in rects)
+        share = area / float(epdbuffer.linewidth(self.epd.width) * 8 * self.epd.height)
+        if share > self.max_area:
+            logging.debug("%.0f%% of the panel changed, full refresh", share * 100)
+            self.full(buf)
+            return "full"
+        # Every refresh flashes the window and waits on BUSY, so the changes all go in one
+        window = bounding_box(rects) if self.driver.windowed else (0, 0, self.epd.width, self.epd.height)
+        logging.debug("partial refresh of %s, %.0f%% of the panel changed", window, share * 100)
+        self._wake(True)
+        self.driver.partial(self.epd, buf, window)
+        self.last = bytes(buf)
+        self.partials += 1
+        return "partial"
+
+    def sleep(self):
+        """Puts the panel to sleep, the next frame wakes it and is still diffed against the last"""
+        self.epd.sleep()
+        self.mode = None
+
+### END OF FILE ###
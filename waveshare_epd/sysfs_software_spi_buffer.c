@@ -0,0 +1,25 @@
+/*****************************************************************************
+* | File        :   sysfs_software_spi_buffer.c
+* | Function    :   Bulk transfer for the Jetson Nano's software SPI
+* | Info        :
+*----------------
+* | Info        :   Waveshare's sysfs_software_spi.so only clocks out one byte
+* |                 per call. This loops over a whole buffer on the C side, so
+* |                 a frame costs one call from Python rather than one per byte.
+* |
+* |                 Build it on the Jetson, next to epdconfig.py:
+* |                   gcc -O2 -shared -fPIC -o sysfs_software_spi_buffer.so sysfs_software_spi_buffer.c
+* |                 The transfer function it calls is left unresolved here and
+* |                 is found in sysfs_software_spi.so, which epdconfig.py loads
+* |                 first with its symbols made global.
+******************************************************************************/
+#include <stdint.h>
+
+extern uint8_t SYSFS_software_spi_transfer(uint8_t value);
+
+void SYSFS_software_spi_transfer_buffer(const uint8_t *buf, uint32_t len)
+{
+    uint32_t i;
+    for (i = 0; i < len; i++)
+        SYSFS_software_spi_transfer(buf[i]);
+}